@@ -1,5 +1,6 @@
 import { useState } from 'react';
 import { Navigation, Search, MapPin, X, Loader } from 'lucide-react';
+import API_BASE from '../config/api';
 
 /**
  * LocationBar – GPS + manual city entry component.
@@ -23,12 +24,20 @@ function LocationBar({ onLocationSelect, activeLabel }) {
         setGpsLoading(true);
         setError('');
         navigator.geolocation.getCurrentPosition(
-            (pos) => {
+            async (pos) => {
+                const { latitude: lat, longitude: lon } = pos.coords;
+                let label = 'Your Location';
+                try {
+                    const res = await fetch(`${API_BASE}/api/reverse-geocode?lat=${lat}&lon=${lon}`);
+                    if (res.ok) label = `Near ${(await res.json()).name}`;
+                } catch {
+                    // keep the generic label
+                }
                 setGpsLoading(false);
                 onLocationSelect({
-                    lat: pos.coords.latitude,
-                    lon: pos.coords.longitude,
-                    label: 'Your Location',
+                    lat,
+                    lon,
+                    label,
                     cityName: null,          // GPS — use /api/nearby-places
                 });
             },
@@ -48,17 +57,16 @@ function LocationBar({ onLocationSelect, activeLabel }) {
         setCityLoading(true);
         setError('');
         try {
-            const res = await fetch(
-                `https://nominatim.openstreetmap.org/search?q=${encodeURIComponent(q)}&format=json&limit=1`,
-                { headers: { 'User-Agent': 'TripPlannerApp/1.0' } }
-            );
+            // Backend geocoder: local gazetteer + shared cache in front of Nominatim
+            const res = await fetch(`${API_BASE}/api/geocode?q=${encodeURIComponent(q)}&limit=1`);
             const data = await res.json();
+            if (!res.ok) throw new Error(data.error);
             if (!data.length) {
                 setError(`"${q}" not found. Try a different name.`);
             } else {
                 onLocationSelect({
-                    lat: parseFloat(data[0].lat),
-                    lon: parseFloat(data[0].lon),
+                    lat: data[0].lat,
+                    lon: data[0].lon,
                     label: data[0].display_name.split(',').slice(0, 2).join(', '),
                     cityName: q,             // original typed text → use /api/places-by-city
                 });
@@ -64,9 +64,9 @@ export default function BudgetEstimation() {
             return;
         }
         try {
-            const res = await fetch(`https://nominatim.openstreetmap.org/search?q=${encodeURIComponent(query)}&format=json&limit=5`);
+            const res = await fetch(`${API_BASE}/api/geocode?q=${encodeURIComponent(query)}&limit=5`);
             const data = await res.json();
-            setResults(data);
+            setResults(Array.isArray(data) ? data : []);
         } catch (err) {
             console.error(err);
         }
@@ -3,6 +3,9 @@ import { useNavigate, Link } from 'react-router-dom';
 import { ChevronLeft, Heart, MapPin } from 'lucide-react';
 import { motion } from 'framer-motion';
 import { useFavorites } from '../hooks/useFavorites';
+import API_BASE from '../config/api';
+
+const BATCH_SIZE = 100; // BATCH_MAX_IDS on the server
 
 function Favorites() {
     const navigate = useNavigate();
@@ -19,15 +22,22 @@ function Favorites() {
             }
 
             try {
-                // Fetch place details for each favorite
-                const placePromises = favorites.map(id =>
-                    fetch(`http://127.0.0.1:5000/api/places/${id}`)
-                        .then(res => res.json())
-                        .catch(() => null)
-                );
-
-                const results = await Promise.all(placePromises);
-                setPlaces(results.filter(p => p !== null));
+                // Fetch details in batch requests of at most BATCH_SIZE ids (the server's limit)
+                const ids = favorites.map(String);
+                const chunks = [];
+                for (let i = 0; i < ids.length; i += BATCH_SIZE) {
+                    chunks.push(ids.slice(i, i + BATCH_SIZE));
+                }
+                const results = await Promise.all(chunks.map(async (chunk) => {
+                    const res = await fetch(`${API_BASE}/api/places/batch`, {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify({ ids: chunk }),
+                    });
+                    const data = await res.json();
+                    return data.places || [];
+                }));
+                setPlaces(results.flat());
             } catch (error) {
                 console.error('Error fetching favorites:', error);
             } finally {
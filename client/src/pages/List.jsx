@@ -56,7 +56,8 @@ function ListPage() {
             let url;
             if (info.cityName) {
                 // Manual city entry — use Nominatim keyword search for real named places
-                url = `${API_BASE}/api/places-by-city?city=${encodeURIComponent(info.cityName)}&slug=${slug}&radius=8`;
+                // lat/lon were already resolved by /api/geocode, so the backend skips geocoding
+                url = `${API_BASE}/api/places-by-city?city=${encodeURIComponent(info.cityName)}&lat=${info.lat}&lon=${info.lon}&slug=${slug}&radius=8`;
             } else {
                 // GPS location — use Overpass bounding box
                 url = `${API_BASE}/api/nearby-places?lat=${info.lat}&lon=${info.lon}&slug=${slug}&radius=5`;
@@ -1,19 +1,32 @@
 from flask import Flask
 from flask_cors import CORS
+import database
 from database import db
 from routes import api
+from schema import upgrade_schema
+from spatial import spatial_index
+from place_store import live_writer
+from jobs import job_runner
 import os
 
-def create_app():
+def create_app(init_database=True, background=True):
+    """
+    init_database: create/upgrade the schema and seed an empty DB. Under gunicorn
+    this runs once before the workers fork (gunicorn.conf.py) and they skip it.
+    background: start the live write-through thread and the job runner.
+    """
     app = Flask(__name__)
-    CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
+    CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True,
+         expose_headers=["X-Next-Cursor", "X-Partial"])
     
-    # Database config — DB_PATH env var for Docker, fallback for local dev
+    # Database config — DATABASE_URL for a server database (e.g. PostgreSQL),
+    # otherwise SQLite at DB_PATH (Docker volume) or next to this file (local dev)
     basedir = os.path.abspath(os.path.dirname(__file__))
     db_path = os.environ.get('DB_PATH') or os.path.join(basedir, 'trip_planner.db')
-    # Ensure the directory exists (important for the Docker named volume path)
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path.replace('\\', '/')
+    uri = database.configure(app, db_path)
+    if uri.startswith('sqlite'):
+        # Ensure the directory exists (important for the Docker named volume path)
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
     db.init_app(app)
@@ -21,15 +34,24 @@ def create_app():
     app.register_blueprint(api, url_prefix='/api')
 
     with app.app_context():
-        db.create_all()
-        _auto_seed()   # seed only if DB is empty
+        if init_database:
+            db.create_all()
+            upgrade_schema()
+            _auto_seed()   # seed only if DB is empty
+        if background:
+            spatial_index.rebuild_in_background(db.engine)
+
+    if background:
+        live_writer.start(app)   # write-through of live OSM results
+        job_runner.start(app)    # background jobs, resuming any left queued
 
     return app
 
 
 def _auto_seed():
     """Seed categories + sample places if the DB is empty (first run / Docker)."""
-    from models import Category, Place
+    from models import Category
+    from place_store import insert_places, upsert_categories
 
     if Category.query.first():
         return   # already seeded
@@ -44,23 +66,21 @@ def _auto_seed():
         {'name': 'Tourist Places', 'slug': 'tourist-places', 'icon': 'map-marked-alt'},
         {'name': 'Trains',         'slug': 'trains',         'icon': 'train'},
         {'name': 'Flights',        'slug': 'flights',        'icon': 'plane'},
+        {'name': 'Emergency',      'slug': 'emergency',      'icon': 'activity'},
     ]
-    for cat_data in categories_data:
-        db.session.add(Category(**cat_data))
-    db.session.commit()
+    cats = upsert_categories(categories_data)
 
     # ── Sample places (Chennai fallback data) ────────────────────────────────
-    cats = {c.slug: c for c in Category.query.all()}
 
     sample_places = [
         # Restaurants
-        dict(category_id=cats['restaurants'].id, name='Saravana Bhavan',
+        dict(category_id=cats['restaurants'], name='Saravana Bhavan',
              description='Famous vegetarian restaurant chain.',
              location='Nelson Manickam Road, Chennai', phone='+91-44-23744050',
              opening_hours='06:00 - 23:00', price_fee='₹200-500',
              crowd_level='High', latitude=13.0694, longitude=80.2102,
              map_link='https://maps.google.com/?q=Saravana+Bhavan+Chennai'),
-        dict(category_id=cats['restaurants'].id, name='Murugan Idli Shop',
+        dict(category_id=cats['restaurants'], name='Murugan Idli Shop',
              description='Authentic South Indian breakfast spot.',
              location='T. Nagar, Chennai', phone='+91-44-24344567',
              opening_hours='06:00 - 22:00', price_fee='₹100-300',
@@ -68,13 +88,13 @@ def _auto_seed():
              map_link='https://maps.google.com/?q=Murugan+Idli+Shop+Chennai'),
 
         # Car Rentals
-        dict(category_id=cats['car-rentals'].id, name='Avis Car Rental',
+        dict(category_id=cats['car-rentals'], name='Avis Car Rental',
              description='Premium car rental with wide selection.',
              location='Anna Salai, Chennai', phone='+91-44-28294444',
              opening_hours='08:00 - 20:00', price_fee='₹1500/day',
              crowd_level='Moderate', latitude=13.0569, longitude=80.2425,
              map_link='https://maps.google.com/?q=Avis+Chennai'),
-        dict(category_id=cats['car-rentals'].id, name='Zoom Car',
+        dict(category_id=cats['car-rentals'], name='Zoom Car',
              description='Self-drive car rentals available 24/7.',
              location='Egmore, Chennai', phone='+91-80-46666666',
              opening_hours='24 hours', price_fee='₹800/day',
@@ -82,13 +102,13 @@ def _auto_seed():
              map_link='https://maps.google.com/?q=Zoomcar+Chennai'),
 
         # Tourist Places
-        dict(category_id=cats['tourist-places'].id, name='Marina Beach',
+        dict(category_id=cats['tourist-places'], name='Marina Beach',
              description='Longest natural urban beach in Asia.',
              location='Kamarajar Salai, Chennai', phone='N/A',
              opening_hours='Open 24 hours', price_fee='Free',
              crowd_level='High', latitude=13.0500, longitude=80.2824,
              map_link='https://maps.google.com/?q=Marina+Beach+Chennai'),
-        dict(category_id=cats['tourist-places'].id, name='Kapaleeshwarar Temple',
+        dict(category_id=cats['tourist-places'], name='Kapaleeshwarar Temple',
              description='Ancient Dravidian-style Shiva temple.',
              location='Mylapore, Chennai', phone='+91-44-24641670',
              opening_hours='06:00 - 12:00, 16:00 - 21:00', price_fee='Free',
@@ -96,7 +116,7 @@ def _auto_seed():
              map_link='https://maps.google.com/?q=Kapaleeshwarar+Temple+Chennai'),
 
         # Bus Timings
-        dict(category_id=cats['bus-timings'].id, name='Chennai Mofussil Bus Terminus',
+        dict(category_id=cats['bus-timings'], name='Chennai Mofussil Bus Terminus',
              description='Major inter-city bus hub (CMBT).',
              location='Koyambedu, Chennai', phone='+91-44-24794949',
              opening_hours='24 hours', price_fee='Varies',
@@ -104,7 +124,7 @@ def _auto_seed():
              map_link='https://maps.google.com/?q=CMBT+Chennai'),
 
         # Trains
-        dict(category_id=cats['trains'].id, name='Chennai Central',
+        dict(category_id=cats['trains'], name='Chennai Central',
              description='Main railway terminus for Chennai.',
              location='Park Town, Chennai', phone='139',
              opening_hours='24 hours', price_fee='Varies',
@@ -112,7 +132,7 @@ def _auto_seed():
              map_link='https://maps.google.com/?q=Chennai+Central+Railway+Station'),
 
         # Flights
-        dict(category_id=cats['flights'].id, name='Chennai International Airport',
+        dict(category_id=cats['flights'], name='Chennai International Airport',
              description='Primary airport serving Chennai.',
              location='Meenambakkam, Chennai', phone='+91-44-22560551',
              opening_hours='24 hours', price_fee='Varies',
@@ -120,13 +140,13 @@ def _auto_seed():
              map_link='https://maps.google.com/?q=Chennai+Airport'),
 
         # Emergency (New additions)
-        dict(category_id=cats['emergency'].id, name='Coimbatore General Hospital',
+        dict(category_id=cats['emergency'], name='Coimbatore General Hospital',
              description='Major government hospital in Coimbatore.',
              location='Trichy Road, Coimbatore', phone='108',
              opening_hours='24 hours', price_fee='Free/Varies',
              crowd_level='High', latitude=11.0018, longitude=76.9628,
              map_link='https://maps.google.com/?q=Coimbatore+General+Hospital'),
-        dict(category_id=cats['emergency'].id, name='Police Commissioner Office',
+        dict(category_id=cats['emergency'], name='Police Commissioner Office',
              description='Central police headquarters for Coimbatore city.',
              location='Hosur Road, Coimbatore', phone='100',
              opening_hours='24 hours', price_fee='Free',
@@ -134,11 +154,10 @@ def _auto_seed():
              map_link='https://maps.google.com/?q=Police+Commissioner+Office+Coimbatore'),
     ]
 
-    for p in sample_places:
-        db.session.add(Place(**p))
+    added = insert_places(sample_places)
     db.session.commit()
 
-    print(f"[startup] Seeded {len(categories_data)} categories and {len(sample_places)} places.")
+    print(f"[startup] Seeded {len(categories_data)} categories and {added} places.")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,141 @@
+"""
+Per-host circuit breakers for upstream APIs.
+
+Every upstream call reports its outcome to its host's breaker. A call counts
+as bad when it fails (connection error, timeout, HTTP 429/5xx) or takes
+longer than the host's slow-call threshold. When at least BREAKER_MIN_CALLS
+of the last BREAKER_WINDOW calls were recorded and BREAKER_ERROR_RATE of them
+were bad, the breaker opens. While open, calls fail at once with CircuitOpen
+instead of waiting out a 25 s Overpass timeout, and callers fall back to
+cached or local data. After BREAKER_OPEN_SECONDS it goes half-open. One probe
+call is then let through: success closes the breaker, failure re-opens it.
+
+A timeout shorter than the slow-call threshold, e.g. one cut short by the
+request budget, is not held against the host.
+"""
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+
+WINDOW       = int(os.environ.get('BREAKER_WINDOW', 20))
+MIN_CALLS    = int(os.environ.get('BREAKER_MIN_CALLS', 5))
+ERROR_RATE   = float(os.environ.get('BREAKER_ERROR_RATE', 0.5))
+OPEN_SECONDS = float(os.environ.get('BREAKER_OPEN_SECONDS', 30))
+SLOW_SECONDS = float(os.environ.get('BREAKER_SLOW_SECONDS', 8))
+
+# host -> seconds after which a call counts as slow (others use SLOW_SECONDS)
+HOST_SLOW_SECONDS = {
+    'overpass-api.de': float(os.environ.get('OVERPASS_BREAKER_SLOW_SECONDS', 20)),
+}
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitOpen(requests.ConnectionError):
+    """The host's breaker is open; the call was not attempted."""
+
+
+class CircuitBreaker:
+    def __init__(self, host, slow_seconds=SLOW_SECONDS):
+        self.host = host
+        self.slow_seconds = slow_seconds
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=WINDOW)     # True = bad
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    def before(self):
+        """Admit a call or raise CircuitOpen. Returns True if the call is the half-open probe."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= OPEN_SECONDS:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+        raise CircuitOpen(f"{self.host} circuit is {self.state}; not calling it")
+
+    def rejecting(self):
+        """True while before() would refuse every call (open, not yet due for a probe)."""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self._opened_at < OPEN_SECONDS
+
+    def after(self, probe, elapsed, error=None, status_code=None):
+        """Record the outcome of a call admitted by before()."""
+        if isinstance(error, requests.RequestException) and not isinstance(error, requests.Timeout):
+            bad = True
+        elif error is not None:
+            # Timeouts and local errors (rate-limit wait) only count when the call was slow
+            bad = True if elapsed >= self.slow_seconds else None
+        else:
+            bad = is_bad_status(status_code) or elapsed >= self.slow_seconds
+        with self._lock:
+            if probe:
+                self._probing = False
+                if bad is None:
+                    return
+                if bad:
+                    self._open()
+                else:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                return
+            if bad is None or self.state != CLOSED:
+                return
+            self._outcomes.append(bad)
+            if len(self._outcomes) >= MIN_CALLS and \
+                    sum(self._outcomes) / len(self._outcomes) >= ERROR_RATE:
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.opened += 1
+        print(f"[breaker] {self.host} opened for {OPEN_SECONDS:g}s")
+
+    def stats(self):
+        with self._lock:
+            recent = len(self._outcomes)
+            stats = {
+                'state':        self.state,
+                'recent_calls': recent,
+                'error_rate':   round(sum(self._outcomes) / recent, 3) if recent else 0.0,
+                'opened':       self.opened,
+                'rejected':     self.rejected,
+            }
+            if self.state != CLOSED:
+                stats['retry_in_s'] = round(max(0.0, OPEN_SECONDS - (time.monotonic() - self._opened_at)), 1)
+            return stats
+
+
+def is_bad_status(status_code):
+    return status_code == 429 or status_code >= 500
+
+
+_breakers = {}
+_lock = threading.Lock()
+
+
+def breaker_for(url):
+    """Return the breaker for the URL's host, creating it on first use."""
+    host = urlsplit(url).netloc
+    with _lock:
+        b = _breakers.get(host)
+        if b is None:
+            b = _breakers[host] = CircuitBreaker(host, HOST_SLOW_SECONDS.get(host, SLOW_SECONDS))
+        return b
+
+
+def stats():
+    with _lock:
+        return {host: b.stats() for host, b in _breakers.items()}
@@ -0,0 +1,293 @@
+"""
+Persistent response cache for upstream lookups (Nominatim, Overpass, OSRM, Open-Meteo).
+
+A bounded in-memory LRU sits in front of a small SQLite file, so repeated
+queries like "restaurant in Coimbatore" are answered without a network round
+trip and the cache survives restarts. Each source has its own TTL, and
+sources listed in SOURCE_STALE_TTLS keep expired entries around for a while
+so callers can serve them stale while refreshing, or while the upstream is
+down: get_or_fetch() falls back to them when the fetch fails.
+
+get_or_fetch() also caches misses, for much less time than real answers, so
+a typo'd city doesn't re-run the whole lookup chain on every attempt. Empty
+answers ([] or {}) are kept for NEGATIVE_TTL. A failed fetch leaves a marker
+for FAILURE_TTL, during which the lookup is not retried.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import deadline
+from singleflight import flight
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+_db_path = os.environ.get('DB_PATH') or os.path.join(basedir, 'trip_planner.db')
+
+CACHE_PATH        = os.environ.get('CACHE_PATH') or os.path.join(os.path.dirname(_db_path), 'upstream_cache.db')
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 5000))
+# Decimal places kept when coordinates are part of a key (3 ≈ 110 m)
+COORD_PRECISION   = int(os.environ.get('CACHE_COORD_PRECISION', 3))
+
+# Seconds a cached response stays fresh, per upstream source
+SOURCE_TTLS = {
+    'nominatim_search':  24 * 3600,
+    'nominatim_geocode': 7 * 24 * 3600,
+    'overpass_tile':     6 * 3600,
+    'overpass_bbox':     6 * 3600,
+    'osm_detail':        24 * 3600,
+    'weather':           10 * 60,
+    'osrm_route':        30 * 24 * 3600,
+    'nominatim_reverse': 30 * 24 * 3600,
+}
+DEFAULT_TTL = 3600
+
+# Seconds an empty answer / a failed fetch is remembered by get_or_fetch()
+NEGATIVE_TTL = float(os.environ.get('CACHE_NEGATIVE_TTL', 15 * 60))
+FAILURE_TTL  = float(os.environ.get('CACHE_FAILURE_TTL', 60))
+
+# Seconds an entry may still be served stale after it expires, per source
+SOURCE_STALE_TTLS = {
+    'osm_detail':        90 * 24 * 3600,
+    'nominatim_search':  7 * 24 * 3600,
+    'nominatim_geocode': 30 * 24 * 3600,
+    'nominatim_reverse': 90 * 24 * 3600,
+    'overpass_tile':     7 * 24 * 3600,
+    'weather':           6 * 3600,
+}
+
+
+def _normalize_part(value):
+    if isinstance(value, float):
+        return f"{round(value, COORD_PRECISION):.{COORD_PRECISION}f}"
+    if isinstance(value, str):
+        return ' '.join(value.lower().split())
+    return str(value)
+
+
+def _is_empty(value):
+    return isinstance(value, (list, dict)) and not value
+
+
+def _failed(source):
+    """Source under which failure markers for `source` are stored."""
+    return f"{source}!failed"
+
+
+def make_key(*parts):
+    """Build a cache key that ignores case, extra whitespace and coordinate jitter."""
+    return '|'.join(_normalize_part(p) for p in parts)
+
+
+def round_coord(value):
+    """A coordinate rounded as make_key() rounds it. Query with this so the answer matches its key."""
+    return round(float(value), COORD_PRECISION)
+
+
+class UpstreamCache:
+    """TTL + LRU cache with SQLite persistence. Safe to share between threads."""
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES, ttls=None, stale_ttls=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttls = dict(SOURCE_TTLS if ttls is None else ttls)
+        self.stale_ttls = dict(SOURCE_STALE_TTLS if stale_ttls is None else stale_ttls)
+        self._memory = OrderedDict()   # (source, key) -> (value, expires_at, stale_until)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.stale_fallbacks = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.negative_writes = 0
+
+    # ── storage ──────────────────────────────────────────────────────────────
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    source      TEXT NOT NULL,
+                    key         TEXT NOT NULL,
+                    value       TEXT NOT NULL,
+                    expires_at  REAL NOT NULL,
+                    stale_until REAL NOT NULL DEFAULT 0,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (source, key)
+                )
+            """)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(entries)")}
+            if 'stale_until' not in columns:
+                self._conn.execute("ALTER TABLE entries ADD COLUMN stale_until REAL NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_entries_last_access ON entries (last_access)")
+            self._conn.commit()
+        return self._conn
+
+    def _remember(self, ident, value, expires_at, stale_until):
+        self._memory[ident] = (value, expires_at, stale_until)
+        self._memory.move_to_end(ident)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _prune_disk(self):
+        db = self._db()
+        (count,) = db.execute("SELECT COUNT(*) FROM entries").fetchone()
+        db.execute("DELETE FROM entries WHERE MAX(expires_at, stale_until) < ?", (time.time(),))
+        if count > self.max_entries:
+            db.execute(
+                "DELETE FROM entries WHERE rowid IN "
+                "(SELECT rowid FROM entries ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    # ── public API ───────────────────────────────────────────────────────────
+
+    def lookup(self, source, key, count=True):
+        """
+        Return (value, fresh). Expired entries still inside their stale window
+        come back with fresh=False; missing ones as (None, False).
+        Pass count=False for internal re-checks that shouldn't skew the stats.
+        """
+        ident = (source, key)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(ident)
+            if entry is None:
+                row = self._db().execute(
+                    "SELECT value, expires_at, stale_until FROM entries WHERE source = ? AND key = ?", ident
+                ).fetchone()
+                if row:
+                    entry = (json.loads(row[0]), row[1], row[2])
+                    self._db().execute(
+                        "UPDATE entries SET last_access = ? WHERE source = ? AND key = ?", (now, *ident)
+                    )
+                    self._db().commit()
+                    self._remember(ident, *entry)
+            if entry is None or max(entry[1], entry[2]) < now:
+                self.misses += count
+                return None, False
+            self._memory.move_to_end(ident)
+            if entry[1] < now:
+                self.stale_hits += count
+                return entry[0], False
+            self.hits += count
+            return entry[0], True
+
+    def get(self, source, key):
+        """Return the cached value, or None if missing or expired."""
+        value, fresh = self.lookup(source, key)
+        return value if fresh else None
+
+    def set(self, source, key, value, ttl=None, stale_ttl=None):
+        ident = (source, key)
+        now = time.time()
+        expires_at = now + (ttl if ttl is not None else self.ttls.get(source, DEFAULT_TTL))
+        stale_until = expires_at + (stale_ttl if stale_ttl is not None else self.stale_ttls.get(source, 0))
+        with self._lock:
+            self._remember(ident, value, expires_at, stale_until)
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO entries (source, key, value, expires_at, stale_until, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (source, key, json.dumps(value), expires_at, stale_until, now),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._prune_disk()
+            db.commit()
+
+    def get_or_fetch(self, source, key, fetch):
+        """
+        Return the cached value for (source, key), calling fetch() on a miss.
+        fetch() returns None (or raises) on failure. An expired copy still inside
+        the source's stale window is then returned instead, and the failure
+        is remembered for FAILURE_TTL so the next callers don't retry at once.
+        Empty answers are cached for NEGATIVE_TTL only. Concurrent misses for
+        the same key share a single fetch.
+        """
+        value = self.get(source, key)
+        if value is not None:
+            if _is_empty(value):
+                self._count_negative_hit()
+            return value
+
+        failed, _ = self.lookup(_failed(source), key, count=False)
+        if failed:
+            self._count_negative_hit()
+            return self._stale_fallback(source, key)
+
+        def fill():
+            # Another thread or worker may have stored it while we waited
+            value, fresh = self.lookup(source, key, count=False)
+            if fresh:
+                return value
+            try:
+                fetched = fetch()
+            except Exception as e:
+                # CircuitOpen, connection errors, bad JSON: a failed fetch like any other
+                print(f"[cache] {source} fetch failed: {e}")
+                fetched = None
+            if fetched is not None:
+                if _is_empty(fetched):
+                    self.set(source, key, fetched, ttl=NEGATIVE_TTL, stale_ttl=0)
+                    self._count_negative_write()
+                else:
+                    self.set(source, key, fetched)
+                return fetched
+            # Not when the caller's own request budget cut the fetch short
+            if deadline.remaining(FAILURE_TTL) >= deadline.MIN_CALL_SECONDS:
+                self.set(_failed(source), key, True, ttl=FAILURE_TTL, stale_ttl=0)
+                self._count_negative_write()
+            return self._stale_fallback(source, key)
+
+        try:
+            return flight.do(f"{source}|{key}", fill)
+        except deadline.DeadlineExceeded:
+            # Out of budget waiting on another caller's fetch: whatever is cached beats nothing
+            return self._stale_fallback(source, key)
+
+    def _stale_fallback(self, source, key):
+        value, _ = self.lookup(source, key, count=False)
+        if value is not None:
+            deadline.mark_partial()
+            with self._lock:
+                self.stale_fallbacks += 1
+        return value
+
+    def _count_negative_hit(self):
+        with self._lock:
+            self.negative_hits += 1
+
+    def _count_negative_write(self):
+        with self._lock:
+            self.negative_writes += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._db().execute("DELETE FROM entries")
+            self._db().commit()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.stale_hits + self.misses
+            return {
+                'hits':            self.hits,
+                'stale_hits':      self.stale_hits,
+                'stale_fallbacks': self.stale_fallbacks,
+                'negative_hits':   self.negative_hits,
+                'negative_writes': self.negative_writes,
+                'misses':          self.misses,
+                'hit_rate':        round(self.hits / total, 3) if total else 0.0,
+                'memory_entries':  len(self._memory),
+                'max_entries':     self.max_entries,
+            }
+
+
+upstream_cache = UpstreamCache()
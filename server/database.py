@@ -1,3 +1,113 @@
+"""
+Flask-SQLAlchemy handle, database configuration and the SQLite connection profile.
+
+The database comes from DATABASE_URL (or SQLALCHEMY_DATABASE_URI); without
+either it is the SQLite file at DB_PATH. Server databases such as PostgreSQL
+get a connection pool sized by the DB_POOL_* env vars. If DATABASE_REPLICA_URL
+is set, views wrapped in @use_replica send their reads to that replica, and
+every write still goes to the primary.
+
+Every new SQLite connection gets WAL journaling (readers stop queueing behind
+the writer), synchronous=NORMAL (durable with WAL, far fewer fsyncs), a busy
+timeout instead of immediate "database is locked", a memory-mapped read path
+and a larger page cache. Each value can be overridden with the SQLITE_* env
+vars below; SQLITE_PROFILE=default leaves SQLite's own defaults alone.
+"""
+import functools
+import os
+import sqlite3
+
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.dml import UpdateBase
+
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'production').lower()
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous':  os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'mmap_size':    int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'cache_size':   int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),   # negative = KiB
+    'temp_store':   'MEMORY',
+}
+
+
+
+def _normalize(uri):
+    if uri.startswith('postgres://'):          # Heroku-style scheme SQLAlchemy no longer accepts
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def database_uri(default_sqlite_path):
+    uri = os.environ.get('DATABASE_URL') or os.environ.get('SQLALCHEMY_DATABASE_URI')
+    if not uri:
+        return 'sqlite:///' + default_sqlite_path.replace('\\', '/')
+    return _normalize(uri)
+
+
+def engine_options(uri):
+    """Pool settings for SQLALCHEMY_ENGINE_OPTIONS. SQLite keeps SQLAlchemy's own pool."""
+    options = {'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1'}
+    if not uri.startswith('sqlite'):
+        options.update(
+            pool_size=int(os.environ.get('DB_POOL_SIZE', 10)),
+            max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+            pool_recycle=int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+            pool_timeout=int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        )
+    return options
+
+
+def configure(app, default_sqlite_path):
+    """Fill in the SQLALCHEMY_* config for the primary and the optional read replica."""
+    uri = database_uri(default_sqlite_path)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(uri)
+    replica = os.environ.get('DATABASE_REPLICA_URL')
+    if replica:
+        replica = _normalize(replica)
+        app.config['SQLALCHEMY_BINDS'] = {'replica': {'url': replica, **engine_options(replica)}}
+    return uri
+
+
+# ── read-replica routing ──────────────────────────────────────────────────────
+
+class RoutingSession(Session):
+    """
+    Sends SELECTs to the 'replica' bind while the current request has opted in
+    (see use_replica). Flushes and INSERT/UPDATE/DELETE statements always use
+    the primary, as does everything when no replica is configured.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and self.info.get('read_replica') and not self._flushing
+                and not isinstance(clause, UpdateBase)):
+            replica = self._db.engines.get('replica')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def use_replica(view):
+    """Route this view's reads to the read replica. For read-only list/detail endpoints."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        db.session.info['read_replica'] = True
+        return view(*args, **kwargs)
+    return wrapper
+
 
-db = SQLAlchemy()
+@event.listens_for(Engine, 'connect')
+def _apply_sqlite_profile(dbapi_connection, connection_record):
+    if SQLITE_PROFILE != 'production' or not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
@@ -0,0 +1,121 @@
+"""
+Per-request latency budgets, passed down to every upstream call.
+
+A view wrapped in @budgeted(name, seconds) runs with a Budget in a
+contextvar. upstream.get()/post() cap each call's timeout, and its wait for a
+rate-limit token, at whatever is left of it, so chained Nominatim → Overpass
+calls share one budget instead of each taking its full timeout. Once the
+budget is spent, further calls fail fast with DeadlineExceeded and the
+endpoint answers with what it has; the response then carries an
+`X-Partial: true` header, and `"partial": true` when the body is a JSON object.
+
+The budget defaults to `seconds`, can be set per endpoint with
+REQUEST_BUDGET_<NAME> and per request with an X-Request-Budget header
+(seconds, capped at MAX_REQUEST_BUDGET). Work handed to a thread pool keeps
+the budget only when submitted through submit().
+"""
+import contextvars
+import functools
+import os
+import time
+
+import requests
+from flask import make_response, request
+
+MAX_REQUEST_BUDGET = float(os.environ.get('MAX_REQUEST_BUDGET', 60))
+MIN_CALL_SECONDS   = 0.2     # don't start an upstream call with less than this left
+
+_current = contextvars.ContextVar('request_budget', default=None)
+
+
+class DeadlineExceeded(requests.Timeout):
+    """The request's budget ran out before this upstream call could be made."""
+
+
+class Budget:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+        self.partial = False
+
+    def remaining(self):
+        return self.expires - time.monotonic()
+
+
+def current():
+    return _current.get()
+
+
+def remaining(default=None):
+    """Seconds left in the current request's budget, or `default` outside a budgeted request."""
+    budget = _current.get()
+    return default if budget is None else max(0.0, budget.remaining())
+
+
+def expires_at():
+    """time.monotonic() at which the current budget runs out, or None."""
+    budget = _current.get()
+    return None if budget is None else budget.expires
+
+
+def timeout(default):
+    """`default` shrunk to the time left. Raises DeadlineExceeded if too little is left to try."""
+    budget = _current.get()
+    if budget is None:
+        return default
+    left = budget.remaining()
+    if left < MIN_CALL_SECONDS:
+        budget.partial = True
+        raise DeadlineExceeded(f"request budget of {budget.seconds:g}s exhausted")
+    return min(default, left)
+
+
+def mark_partial():
+    """Flag the current response as incomplete (a lookup was skipped, timed out or fell back)."""
+    budget = _current.get()
+    if budget is not None:
+        budget.partial = True
+
+
+def submit(pool, fn, *args, **kwargs):
+    """pool.submit() that carries the caller's budget into the worker thread."""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def _requested(default_seconds):
+    header = request.headers.get('X-Request-Budget')
+    if header:
+        try:
+            return min(max(float(header), MIN_CALL_SECONDS), MAX_REQUEST_BUDGET)
+        except ValueError:
+            pass
+    return default_seconds
+
+
+def _mark(rv):
+    resp = make_response(rv)
+    resp.headers['X-Partial'] = 'true'
+    if resp.is_json:
+        body = resp.get_json(silent=True)
+        if isinstance(body, dict):
+            body['partial'] = True
+            resp.set_data(resp.json_module.dumps(body))
+    return resp
+
+
+def budgeted(name, default_seconds):
+    """Run the view under a latency budget (see module docstring)."""
+    seconds = float(os.environ.get(f"REQUEST_BUDGET_{name.upper()}", default_seconds))
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            budget = Budget(_requested(seconds))
+            token = _current.set(budget)
+            try:
+                rv = view(*args, **kwargs)
+            finally:
+                _current.reset(token)
+            return _mark(rv) if budget.partial else rv
+        return wrapper
+    return decorator
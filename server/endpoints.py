@@ -0,0 +1,148 @@
+"""
+Pools of equivalent upstream endpoints (Overpass and Nominatim mirrors).
+
+Each service is configured with a comma-separated list of base URLs:
+
+    OVERPASS_URLS=https://overpass-api.de/api/interpreter,https://overpass.kumi.systems/api/interpreter
+    NOMINATIM_URLS=https://nominatim.openstreetmap.org,http://nominatim.internal:8080
+
+upstream.hedged_get()/hedged_post() pick an endpoint at random, weighted by
+its health: the recent success rate divided by the typical latency. Endpoints
+whose circuit breaker is open are skipped. If the first endpoint hasn't
+answered after the pool's hedge delay, a second request goes to another
+endpoint. The hedge delay is the p95 of recent latencies, clamped to
+[HEDGE_MIN_DELAY, HEDGE_MAX_DELAY]. Whichever answers first wins and the
+other is cancelled. A pool with one URL never hedges.
+
+Rate limits (ratelimit.HOST_LIMITS) and breakers stay per host, so a mirror
+gets its own bucket and its own breaker.
+"""
+import os
+import random
+import threading
+from collections import deque
+from urllib.parse import urlsplit
+
+import breaker
+
+HEDGE_REQUESTS      = os.environ.get('HEDGE_REQUESTS', '1').lower() not in ('0', 'false', 'off')
+HEDGE_MIN_DELAY     = float(os.environ.get('HEDGE_MIN_DELAY', 0.05))
+HEDGE_MAX_DELAY     = float(os.environ.get('HEDGE_MAX_DELAY', 5))
+HEDGE_DEFAULT_DELAY = float(os.environ.get('HEDGE_DEFAULT_DELAY', 1.0))   # until there are samples
+HEDGE_MIN_SAMPLES   = 20
+_LATENCY_SAMPLES    = 200
+_ALPHA              = 0.2    # weight of the newest outcome in the moving averages
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+class Endpoint:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.host = urlsplit(self.url).netloc
+        self.success_rate = 1.0
+        self.latency = None          # moving average of successful calls, seconds
+        self.requests = 0
+        self.failures = 0
+
+    def weight(self):
+        return max(self.success_rate, 0.05) / max(self.latency or 1.0, 0.05)
+
+
+class EndpointPool:
+    def __init__(self, name, urls, slow_seconds=None):
+        self.name = name
+        self.endpoints = [Endpoint(u) for u in urls if u.strip()]
+        if not self.endpoints:
+            raise ValueError(f"endpoint pool {name!r} has no URLs")
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=_LATENCY_SAMPLES)
+        self.hedged = 0
+        self.hedge_wins = 0
+        if slow_seconds is not None:
+            for ep in self.endpoints:
+                breaker.HOST_SLOW_SECONDS.setdefault(ep.host, slow_seconds)
+
+    def pick(self, n=1):
+        """Up to n distinct endpoints, drawn by health weight; open breakers only as a last resort."""
+        with self._lock:
+            candidates = [ep for ep in self.endpoints
+                          if not breaker.breaker_for(ep.url).rejecting()] or list(self.endpoints)
+            chosen = []
+            while candidates and len(chosen) < n:
+                ep = random.choices(candidates, weights=[c.weight() for c in candidates])[0]
+                candidates.remove(ep)
+                chosen.append(ep)
+            return chosen
+
+    def hedge_delay(self):
+        """Seconds to wait for the first endpoint before asking a second one."""
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return HEDGE_DEFAULT_DELAY
+            p95 = _percentile(self._latencies, 0.95)
+        return min(max(p95, HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+
+    def can_hedge(self):
+        return HEDGE_REQUESTS and len(self.endpoints) > 1
+
+    def record(self, ep, elapsed, ok):
+        with self._lock:
+            ep.requests += 1
+            ep.success_rate += _ALPHA * ((1.0 if ok else 0.0) - ep.success_rate)
+            if ok:
+                ep.latency = elapsed if ep.latency is None else ep.latency + _ALPHA * (elapsed - ep.latency)
+                self._latencies.append(elapsed)
+            else:
+                ep.failures += 1
+
+    def record_loss(self, ep, elapsed):
+        """An attempt cancelled because another endpoint answered first: it took at least `elapsed`."""
+        with self._lock:
+            ep.requests += 1
+            if ep.latency is None:
+                ep.latency = elapsed
+            elif elapsed > ep.latency:
+                ep.latency += _ALPHA * (elapsed - ep.latency)
+
+    def count_hedge(self):
+        with self._lock:
+            self.hedged += 1
+
+    def count_hedge_win(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def stats(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            return {
+                'endpoints': [{
+                    'url':          ep.url,
+                    'requests':     ep.requests,
+                    'failures':     ep.failures,
+                    'success_rate': round(ep.success_rate, 3),
+                    'latency_ms':   round(ep.latency * 1000, 1) if ep.latency is not None else None,
+                } for ep in self.endpoints],
+                'p95_ms':     round(_percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+                'hedged':     self.hedged,
+                'hedge_wins': self.hedge_wins,
+            }
+
+
+def _urls(var, default):
+    return [u.strip() for u in os.environ.get(var, default).split(',') if u.strip()]
+
+
+overpass_pool  = EndpointPool('overpass', _urls('OVERPASS_URLS', 'https://overpass-api.de/api/interpreter'),
+                              slow_seconds=breaker.HOST_SLOW_SECONDS['overpass-api.de'])
+nominatim_pool = EndpointPool('nominatim', _urls('NOMINATIM_URLS', 'https://nominatim.openstreetmap.org'))
+
+POOLS = (overpass_pool, nominatim_pool)
+
+
+def stats():
+    return {pool.name: pool.stats() for pool in POOLS}
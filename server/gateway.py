@@ -0,0 +1,214 @@
+"""
+Asyncio gateway for upstream HTTP.
+
+When aiohttp is installed, upstream.get()/post() hand their request to one
+event loop running on its own thread in each worker process, and wait on a
+future for the answer. All outbound I/O is multiplexed on that loop, so
+hundreds of slow Nominatim/Overpass calls in flight cost sockets, not
+threads: FANOUT_WORKERS and gunicorn threads go to request handling, and a
+batch of upstream calls started together no longer needs a thread apiece.
+
+- A per-host semaphore (UPSTREAM_HOST_CONCURRENCY) caps how many requests
+  one host sees at once; callers beyond it queue on the loop.
+- The host's rate governor is awaited (acquire_async), not blocked on,
+  before every attempt: retries of 502/503/504 and connection errors take
+  a token too.
+- Waiting for a token or a slot counts against the caller's request
+  budget (deadline.py); the call's timeout is whatever is left of it.
+- A caller that gives up (timeout, deadline, its greenlet/thread being
+  killed) cancels the request on the loop, freeing the connection slot.
+
+Without aiohttp, or under gevent (where the workers already multiplex on
+greenlets), upstream keeps using its pooled requests sessions.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import CancelledError
+from urllib.parse import urlsplit
+
+import requests
+
+import deadline
+import ratelimit
+from ratelimit import INTERACTIVE
+
+try:
+    import aiohttp
+except ImportError:               # optional dependency
+    aiohttp = None
+
+UPSTREAM_ASYNC   = os.environ.get('UPSTREAM_ASYNC', 'auto').lower()    # auto | 1 | 0
+HOST_CONCURRENCY = int(os.environ.get('UPSTREAM_HOST_CONCURRENCY', 8))
+
+_RETRY_STATUS = (502, 503, 504)
+
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def wanted():
+    """Whether upstream should route through the gateway in this process."""
+    if UPSTREAM_ASYNC in ('0', 'false', 'off'):
+        return False
+    if aiohttp is None:
+        if UPSTREAM_ASYNC in ('1', 'true', 'on'):
+            raise RuntimeError("UPSTREAM_ASYNC=1 needs aiohttp:  pip install aiohttp")
+        return False
+    return not _gevent_patched()
+
+
+class GatewayResponse:
+    """The parts of requests.Response the routes use."""
+
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError(f"{self.status_code} for url: {self.url}", response=self)
+
+
+class AsyncGateway:
+    def __init__(self, user_agent, retries, backoff, host_concurrency=HOST_CONCURRENCY):
+        self.user_agent = user_agent
+        self.retries = retries
+        self.backoff = backoff
+        self.host_concurrency = host_concurrency
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pid = None
+        self._session = None
+        self._semaphores = {}
+        self._in_flight = {}
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    # ── loop lifecycle ───────────────────────────────────────────────────────
+
+    def _ensure_loop(self):
+        """Start the loop thread on first use, and again after a fork (gunicorn workers)."""
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='upstream-gateway', daemon=True).start()
+                self._loop, self._pid = loop, os.getpid()
+                self._session, self._semaphores, self._in_flight = None, {}, {}
+            return self._loop
+
+    def _client(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                headers={'User-Agent': self.user_agent},
+                connector=aiohttp.TCPConnector(limit=0, limit_per_host=self.host_concurrency,
+                                               keepalive_timeout=30),
+            )
+        return self._session
+
+    # ── requests ─────────────────────────────────────────────────────────────
+
+    async def _send(self, method, url, timeout, priority, params=None, data=None, json_body=None,
+                    headers=None, max_wait=ratelimit.MAX_WAIT, expires=None):
+        host = urlsplit(url).netloc
+        gov = ratelimit.governor_for(host)
+        wait_until = time.monotonic() + max_wait
+        sem = self._semaphores.setdefault(host, asyncio.Semaphore(self.host_concurrency))
+
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            if gov is not None:
+                # Every attempt, retries included, takes a token
+                await gov.acquire_async(priority, max(0.0, wait_until - time.monotonic()))
+            async with sem:
+                call_timeout = timeout
+                if expires is not None:
+                    # Time spent queueing comes out of the caller's request budget
+                    left = expires - time.monotonic()
+                    if left < deadline.MIN_CALL_SECONDS:
+                        raise deadline.DeadlineExceeded(f"{method} {url}: request budget exhausted")
+                    call_timeout = min(timeout, left)
+                self._in_flight[host] = self._in_flight.get(host, 0) + 1
+                try:
+                    async with self._client().request(
+                        method, url, params=params, data=data, json=json_body, headers=headers,
+                        timeout=aiohttp.ClientTimeout(total=call_timeout),
+                    ) as resp:
+                        body = await resp.read()
+                        if resp.status not in _RETRY_STATUS or last or not self._can_retry(attempt, expires):
+                            return GatewayResponse(str(resp.url), resp.status, dict(resp.headers), body)
+                except asyncio.TimeoutError:
+                    raise requests.Timeout(f"{method} {url} timed out after {call_timeout}s")
+                except aiohttp.ClientConnectionError as e:
+                    if last or not self._can_retry(attempt, expires):
+                        raise requests.ConnectionError(str(e))
+                finally:
+                    self._in_flight[host] -= 1
+            await asyncio.sleep(self.backoff * (2 ** attempt))
+
+    def _can_retry(self, attempt, expires):
+        """Whether the caller's budget has room for the backoff and another call."""
+        left = float('inf') if expires is None else expires - time.monotonic()
+        return left >= self.backoff * (2 ** attempt) + deadline.MIN_CALL_SECONDS
+
+    def submit(self, method, url, timeout, priority=INTERACTIVE, **kwargs):
+        """
+        Schedule a request on the loop; returns a concurrent.futures.Future of
+        GatewayResponse. Cancelling the future aborts the request.
+        """
+        if 'json' in kwargs:
+            kwargs['json_body'] = kwargs.pop('json')
+        future = asyncio.run_coroutine_threadsafe(
+            self._send(method, url, timeout, priority, **kwargs), self._ensure_loop()
+        )
+        future.add_done_callback(self._count)
+        return future
+
+    def _count(self, future):
+        if future.cancelled():
+            self.cancelled += 1
+        elif future.exception() is not None:
+            self.failed += 1
+        else:
+            self.completed += 1
+
+    def request(self, method, url, timeout, priority=INTERACTIVE, **kwargs):
+        """Blocking call for thread-based callers; cancels the request if the caller stops waiting."""
+        future = self.submit(method, url, timeout, priority, **kwargs)
+        try:
+            return future.result()
+        except CancelledError:
+            raise requests.ConnectionError(f"{method} {url} was cancelled")
+        except BaseException:
+            future.cancel()
+            raise
+
+    def stats(self):
+        return {
+            'host_concurrency': self.host_concurrency,
+            'in_flight': {h: n for h, n in self._in_flight.items() if n},
+            'completed': self.completed,
+            'failed': self.failed,
+            'cancelled': self.cancelled,
+        }
@@ -0,0 +1,183 @@
+"""
+Local gazetteer of known cities, consulted before Nominatim.
+
+A built-in list covers the cities this app is mostly used for. Set
+GAZETTEER_PATH to a GeoNames dump (cities500.txt, cities15000.txt, ... from
+download.geonames.org/export/dump/) to add more. A name is matched alone or
+with its region and/or country ("Coimbatore", "coimbatore, tamil nadu",
+"Coimbatore India"), ignoring case and punctuation. Reverse lookups return
+the nearest city within GAZETTEER_REVERSE_KM.
+"""
+import math
+import os
+import re
+import threading
+
+from spatial import haversine_km
+
+GAZETTEER_PATH = os.environ.get('GAZETTEER_PATH', '')
+REVERSE_KM     = float(os.environ.get('GAZETTEER_REVERSE_KM', 15))
+
+# (name, region, country, lat, lon, other names)
+KNOWN_CITIES = (
+    ('Mumbai',             'Maharashtra',      'India',       19.0760,   72.8777, ('Bombay',)),
+    ('New Delhi',          'Delhi',            'India',       28.6139,   77.2090, ('Delhi',)),
+    ('Bengaluru',          'Karnataka',        'India',       12.9716,   77.5946, ('Bangalore',)),
+    ('Chennai',            'Tamil Nadu',       'India',       13.0827,   80.2707, ('Madras',)),
+    ('Kolkata',            'West Bengal',      'India',       22.5726,   88.3639, ('Calcutta',)),
+    ('Hyderabad',          'Telangana',        'India',       17.3850,   78.4867, ()),
+    ('Pune',               'Maharashtra',      'India',       18.5204,   73.8567, ()),
+    ('Ahmedabad',          'Gujarat',          'India',       23.0225,   72.5714, ()),
+    ('Surat',              'Gujarat',          'India',       21.1702,   72.8311, ()),
+    ('Jaipur',             'Rajasthan',        'India',       26.9124,   75.7873, ()),
+    ('Udaipur',            'Rajasthan',        'India',       24.5854,   73.7125, ()),
+    ('Lucknow',            'Uttar Pradesh',    'India',       26.8467,   80.9462, ()),
+    ('Agra',               'Uttar Pradesh',    'India',       27.1767,   78.0081, ()),
+    ('Varanasi',           'Uttar Pradesh',    'India',       25.3176,   82.9739, ('Benares',)),
+    ('Patna',              'Bihar',            'India',       25.5941,   85.1376, ()),
+    ('Chandigarh',         'Chandigarh',       'India',       30.7333,   76.7794, ()),
+    ('Amritsar',           'Punjab',           'India',       31.6340,   74.8723, ()),
+    ('Shimla',             'Himachal Pradesh', 'India',       31.1048,   77.1734, ()),
+    ('Manali',             'Himachal Pradesh', 'India',       32.2432,   77.1892, ()),
+    ('Rishikesh',          'Uttarakhand',      'India',       30.0869,   78.2676, ()),
+    ('Srinagar',           'Jammu and Kashmir', 'India',      34.0837,   74.7973, ()),
+    ('Leh',                'Ladakh',           'India',       34.1526,   77.5771, ()),
+    ('Indore',             'Madhya Pradesh',   'India',       22.7196,   75.8577, ()),
+    ('Bhopal',             'Madhya Pradesh',   'India',       23.2599,   77.4126, ()),
+    ('Nagpur',             'Maharashtra',      'India',       21.1458,   79.0882, ()),
+    ('Bhubaneswar',        'Odisha',           'India',       20.2961,   85.8245, ()),
+    ('Guwahati',           'Assam',            'India',       26.1445,   91.7362, ()),
+    ('Darjeeling',         'West Bengal',      'India',       27.0410,   88.2663, ()),
+    ('Panaji',             'Goa',              'India',       15.4909,   73.8278, ('Panjim',)),
+    ('Visakhapatnam',      'Andhra Pradesh',   'India',       17.6868,   83.2185, ('Vizag',)),
+    ('Vijayawada',         'Andhra Pradesh',   'India',       16.5062,   80.6480, ()),
+    ('Tirupati',           'Andhra Pradesh',   'India',       13.6288,   79.4192, ()),
+    ('Mysuru',             'Karnataka',        'India',       12.2958,   76.6394, ('Mysore',)),
+    ('Mangaluru',          'Karnataka',        'India',       12.9141,   74.8560, ('Mangalore',)),
+    ('Hampi',              'Karnataka',        'India',       15.3350,   76.4600, ()),
+    ('Kochi',              'Kerala',           'India',        9.9312,   76.2673, ('Cochin',)),
+    ('Thiruvananthapuram', 'Kerala',           'India',        8.5241,   76.9366, ('Trivandrum',)),
+    ('Kozhikode',          'Kerala',           'India',       11.2588,   75.7804, ('Calicut',)),
+    ('Munnar',             'Kerala',           'India',       10.0889,   77.0595, ()),
+    ('Coimbatore',         'Tamil Nadu',       'India',       11.0168,   76.9558, ('Kovai',)),
+    ('Madurai',            'Tamil Nadu',       'India',        9.9252,   78.1198, ()),
+    ('Tiruchirappalli',    'Tamil Nadu',       'India',       10.7905,   78.7047, ('Trichy',)),
+    ('Salem',              'Tamil Nadu',       'India',       11.6643,   78.1460, ()),
+    ('Erode',              'Tamil Nadu',       'India',       11.3410,   77.7172, ()),
+    ('Tiruppur',           'Tamil Nadu',       'India',       11.1085,   77.3411, ('Tirupur',)),
+    ('Vellore',            'Tamil Nadu',       'India',       12.9165,   79.1325, ()),
+    ('Thanjavur',          'Tamil Nadu',       'India',       10.7870,   79.1378, ('Tanjore',)),
+    ('Tirunelveli',        'Tamil Nadu',       'India',        8.7139,   77.7567, ()),
+    ('Kanyakumari',        'Tamil Nadu',       'India',        8.0883,   77.5385, ()),
+    ('Rameswaram',         'Tamil Nadu',       'India',        9.2876,   79.3129, ()),
+    ('Ooty',               'Tamil Nadu',       'India',       11.4102,   76.6950, ('Udhagamandalam',)),
+    ('Kodaikanal',         'Tamil Nadu',       'India',       10.2381,   77.4892, ()),
+    ('Puducherry',         'Puducherry',       'India',       11.9416,   79.8083, ('Pondicherry',)),
+    ('Colombo',            'Western Province', 'Sri Lanka',    6.9271,   79.8612, ()),
+    ('Kathmandu',          'Bagmati',          'Nepal',       27.7172,   85.3240, ()),
+    ('Dubai',              'Dubai',            'United Arab Emirates', 25.2048, 55.2708, ()),
+    ('Singapore',          'Singapore',        'Singapore',    1.3521,  103.8198, ()),
+    ('Bangkok',            'Bangkok',          'Thailand',    13.7563,  100.5018, ()),
+    ('Tokyo',              'Tokyo',            'Japan',       35.6762,  139.6503, ()),
+    ('Sydney',             'New South Wales',  'Australia',  -33.8688,  151.2093, ()),
+    ('London',             'England',          'United Kingdom', 51.5074, -0.1278, ()),
+    ('Paris',              'Ile-de-France',    'France',      48.8566,    2.3522, ()),
+    ('New York',           'New York',         'United States', 40.7128, -74.0060, ('New York City', 'NYC')),
+)
+
+_PUNCT = re.compile(r'[^\w\s]')
+
+
+def normalize(text):
+    """'  Coimbatore, Tamil-Nadu ' -> 'coimbatore tamil nadu'"""
+    return ' '.join(_PUNCT.sub(' ', (text or '').lower()).split())
+
+
+class Gazetteer:
+    def __init__(self, path=GAZETTEER_PATH):
+        self.path = path
+        self._by_name = None
+        self._grid = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # ── loading ──────────────────────────────────────────────────────────────
+
+    def _load(self):
+        with self._lock:
+            if self._by_name is not None:
+                return
+            by_name, grid = {}, {}
+
+            def add(names, region, country, lat, lon, population):
+                entry = {
+                    'name':         names[0],
+                    'display_name': ', '.join(p for p in (names[0], region, country) if p),
+                    'lat':          lat,
+                    'lon':          lon,
+                    'population':   population,
+                }
+                for name in names:
+                    for parts in ((name,), (name, region), (name, country), (name, region, country)):
+                        key = normalize(' '.join(p for p in parts if p))
+                        # Ambiguous names go to the larger place, as Nominatim would rank them
+                        if key and (key not in by_name or by_name[key]['population'] < population):
+                            by_name[key] = entry
+                grid.setdefault((math.floor(lat), math.floor(lon)), []).append(entry)
+
+            for name, region, country, lat, lon, aliases in KNOWN_CITIES:
+                # The curated list wins over any same-named GeoNames entry
+                add((name,) + aliases, region, country, lat, lon, population=math.inf)
+            if self.path:
+                loaded = self._load_geonames(add)
+                print(f"[gazetteer] loaded {loaded} places from {self.path}")
+            self._grid = grid
+            self._by_name = by_name
+
+    def _load_geonames(self, add):
+        """Tab-separated GeoNames 'cities' dump: name, asciiname, lat, lon, country code, population."""
+        loaded = 0
+        with open(self.path, encoding='utf-8') as fh:
+            for line in fh:
+                cols = line.rstrip('\n').split('\t')
+                if len(cols) < 15 or cols[6] != 'P':
+                    continue
+                names = tuple(dict.fromkeys(n for n in (cols[1], cols[2]) if n))
+                add(names, '', cols[8], float(cols[4]), float(cols[5]), int(cols[14] or 0))
+                loaded += 1
+        return loaded
+
+    # ── lookups ──────────────────────────────────────────────────────────────
+
+    def lookup(self, query):
+        """The known city matching `query`, or None."""
+        self._load()
+        entry = self._by_name.get(normalize(query))
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def nearest(self, lat, lon, max_km=REVERSE_KM):
+        """(distance_km, entry) for the closest known city within max_km, or None."""
+        self._load()
+        best = None
+        row, col = math.floor(lat), math.floor(lon)
+        for dlat in (-1, 0, 1):
+            for dlon in (-1, 0, 1):
+                for entry in self._grid.get((row + dlat, col + dlon), ()):
+                    dist = haversine_km(lat, lon, entry['lat'], entry['lon'])
+                    if dist <= max_km and (best is None or dist < best[0]):
+                        best = (dist, entry)
+        return best
+
+    def stats(self):
+        self._load()
+        with self._lock:
+            return {'entries': len(self._by_name), 'hits': self.hits, 'misses': self.misses}
+
+
+gazetteer = Gazetteer()
@@ -0,0 +1,56 @@
+"""
+Gunicorn settings for the API. Every value can be overridden from the
+environment.
+
+Most routes spend their time waiting on Nominatim, Overpass, OSRM or
+Open-Meteo, so the default worker class is gthread: a few processes, each
+with a pool of threads. One slow Overpass call then holds a single thread
+instead of a whole worker. WEB_WORKER_CLASS=gevent also works if gevent is
+installed.
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+
+_db_dir = os.path.dirname(os.environ.get('DB_PATH') or os.path.join(os.path.dirname(__file__), 'trip_planner.db'))
+
+bind              = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+worker_class      = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+workers           = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+threads           = int(os.environ.get('GUNICORN_THREADS', 16))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))   # gevent only
+
+# The slowest upstream call is an Overpass query (25 s) after up to
+# RATE_LIMIT_MAX_WAIT (10 s) in the rate governor's queue. Give requests in
+# flight that long to finish on reload/shutdown, and only kill a worker that
+# has stopped heartbeating for longer than any single request can take.
+timeout           = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout  = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 40))
+keepalive         = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+max_requests        = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 0))
+reload            = os.environ.get('GUNICORN_RELOAD') == '1'
+accesslog         = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog          = '-'
+
+# Workers are separate processes: share the upstream rate limits and
+# in-flight request coalescing through files next to the database, unless
+# configured otherwise. Set here so every forked worker inherits them.
+os.environ.setdefault('RATE_LIMIT_DB', os.path.join(_db_dir, 'ratelimit.db'))
+os.environ.setdefault('SINGLEFLIGHT_LOCK_DIR', os.path.join(_db_dir, 'locks'))
+
+
+def on_starting(server):
+    """
+    Create, upgrade and seed the database once, before any worker forks. It
+    runs in a child process so the master never imports the app: with
+    GUNICORN_RELOAD=1 each restarted worker then loads the edited code.
+    """
+    subprocess.run([sys.executable, '-c',
+                    'from app import create_app; create_app(init_database=True, background=False)'],
+                   cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    os.environ['TRIP_PLANNER_DB_READY'] = '1'
+    server.log.info("database ready; starting %s %s worker(s) x %s thread(s)",
+                    workers, worker_class, threads)
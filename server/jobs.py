@@ -0,0 +1,150 @@
+"""
+Background jobs backed by the Job table.
+
+Slow work such as OSM ingestion for /api/fetch-data runs on a small thread
+pool instead of blocking a request thread. Job state lives in the database,
+so GET /api/jobs/<id> answers from any worker process. Cancellation is a flag
+the job checks each time it reports progress. Jobs still queued, or left
+running by a process that died, are picked up again when the app next starts.
+"""
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from sqlalchemy import select, update
+
+from database import db
+from models import Job
+from place_store import utcnow
+
+JOB_WORKERS       = int(os.environ.get('JOB_WORKERS', 2))          # jobs running at once, per process
+JOB_MAX_PENDING   = int(os.environ.get('JOB_MAX_PENDING', 20))     # queued + running before submit refuses
+JOB_STALE_SECONDS = float(os.environ.get('JOB_STALE_SECONDS', 300))
+
+ACTIVE = ('queued', 'running')
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobContext:
+    """Passed to a job handler for reporting progress and noticing cancellation."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def progress(self, done, total=None, message=None):
+        """Record progress and heartbeat. Raises JobCancelled once a cancel was requested."""
+        values = {'progress': done, 'heartbeat_at': utcnow()}
+        if total is not None:
+            values['total'] = total
+        if message is not None:
+            values['message'] = message[:200]
+        db.session.execute(update(Job).where(Job.id == self.job_id).values(**values))
+        db.session.commit()
+        if db.session.scalar(select(Job.cancel_requested).where(Job.id == self.job_id)):
+            raise JobCancelled()
+
+
+class JobRunner:
+    def __init__(self, workers=JOB_WORKERS):
+        self._handlers = {}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._app = None
+
+    def register(self, kind, handler):
+        """handler(ctx, **params) -> JSON-serialisable result."""
+        self._handlers[kind] = handler
+
+    def start(self, app):
+        """Attach the app and resume jobs left queued, or orphaned by a dead process."""
+        self._app = app
+        stale = utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+        with app.app_context():
+            db.session.execute(
+                update(Job)
+                .where(Job.status == 'running', Job.heartbeat_at < stale)
+                .values(status='queued')
+            )
+            db.session.commit()
+            pending = db.session.scalars(
+                select(Job.id).where(Job.status == 'queued').order_by(Job.created_at)
+            ).all()
+        for job_id in pending:
+            self._pool.submit(self._run, job_id)
+        if pending:
+            print(f"[jobs] resumed {len(pending)} queued job(s)")
+
+    def submit(self, kind, params):
+        """
+        Queue a job and return its Job row. An identical job that is already
+        queued or running is returned instead of starting a second one.
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        encoded = json.dumps(params, sort_keys=True)
+        existing = Job.query.filter(Job.kind == kind, Job.params == encoded,
+                                    Job.status.in_(ACTIVE)).first()
+        if existing:
+            return existing
+        if Job.query.filter(Job.status.in_(ACTIVE)).count() >= JOB_MAX_PENDING:
+            raise QueueFull(f"Too many pending jobs (max {JOB_MAX_PENDING})")
+
+        job = Job(id=uuid.uuid4().hex, kind=kind, params=encoded, status='queued', created_at=utcnow())
+        db.session.add(job)
+        db.session.commit()
+        self._pool.submit(self._run, job.id)
+        return job
+
+    def cancel(self, job_id):
+        """Cancel a queued job outright, or flag a running one to stop. Returns the Job or None."""
+        result = db.session.execute(
+            update(Job).where(Job.id == job_id, Job.status == 'queued')
+            .values(status='cancelled', finished_at=utcnow())
+        )
+        if not result.rowcount:
+            db.session.execute(
+                update(Job).where(Job.id == job_id, Job.status == 'running').values(cancel_requested=True)
+            )
+        db.session.commit()
+        return db.session.get(Job, job_id, populate_existing=True)
+
+    def _run(self, job_id):
+        with self._app.app_context():
+            now = utcnow()
+            claimed = db.session.execute(       # only one worker/process wins a queued job
+                update(Job).where(Job.id == job_id, Job.status == 'queued')
+                .values(status='running', started_at=now, heartbeat_at=now)
+            ).rowcount
+            db.session.commit()
+            if not claimed:
+                return
+
+            job = db.session.get(Job, job_id)
+            kind, params = job.kind, json.loads(job.params)
+            try:
+                handler = self._handlers.get(kind)
+                if handler is None:
+                    raise ValueError(f"Unknown job kind: {kind}")
+                values = {'status': 'done', 'result': json.dumps(handler(JobContext(job_id), **params))}
+            except JobCancelled:
+                db.session.rollback()
+                values = {'status': 'cancelled'}
+            except Exception as e:
+                db.session.rollback()
+                print(f"[jobs] {kind} {job_id} failed: {e}")
+                values = {'status': 'failed', 'error': str(e)}
+
+            values['finished_at'] = utcnow()
+            db.session.execute(update(Job).where(Job.id == job_id).values(**values))
+            db.session.commit()
+
+
+job_runner = JobRunner()
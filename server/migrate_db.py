@@ -7,8 +7,8 @@ Database migration script to add new features:
 
 from app import create_app
 from database import db
-from models import Category, Place
-import random
+from models import Category
+from place_store import insert_places, upsert_categories
 
 def migrate_database():
     app = create_app()
@@ -33,10 +33,7 @@ def migrate_database():
             {'name': 'Flights', 'slug': 'flights', 'icon': 'plane'}
         ]
         
-        for cat_data in categories_data:
-            category = Category(**cat_data)
-            db.session.add(category)
-        
+        upsert_categories(categories_data)
         db.session.commit()
         print(f"Created {len(categories_data)} categories")
         
@@ -388,12 +385,9 @@ def migrate_database():
 
         # Add all places
         all_places = car_rentals + restaurants + tourist_places + trains + flights + bus_timings + hotels
-        for place_data in all_places:
-            place = Place(**place_data)
-            db.session.add(place)
-        
+        added = insert_places(all_places)
         db.session.commit()
-        print(f"Added {len(all_places)} places")
+        print(f"Added {added} places")
         print("Migration completed successfully!")
 
 if __name__ == '__main__':
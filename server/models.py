@@ -1,5 +1,20 @@
+import json
+import re
 from database import db
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import func, select, text
+
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_name(name):
+    """Dedup key for place names: case- and whitespace-insensitive."""
+    return _SPACES.sub(' ', name or '').strip().lower()[:200]
+
+
+def _default_name_key(context):
+    return normalize_name(context.get_current_parameters().get('name'))
+
 
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -31,7 +46,29 @@ class Place(db.Model):
     longitude = db.Column(db.Float, nullable=True)
     rating = db.Column(db.Float, nullable=True)  # 1.0 to 5.0 for star ratings
 
-    category = db.relationship('Category', backref=db.backref('places', lazy=True))
+    # OpenStreetMap provenance — NULL for hand-seeded places
+    source = db.Column(db.String(20), nullable=True)      # 'osm_import', 'live', 'nominatim'
+    osm_type = db.Column(db.String(10), nullable=True)    # node, way, relation
+    osm_id = db.Column(db.BigInteger, nullable=True)
+    tags = db.Column(db.Text, nullable=True)              # raw OSM tags as JSON
+    last_seen = db.Column(db.DateTime, nullable=True)
+
+    # normalize_name(name); unique per category among non-OSM places
+    name_key = db.Column(db.String(200), nullable=True, default=_default_name_key)
+
+    __table_args__ = (
+        # Keyset pagination: WHERE category_id = ? ORDER BY <sort>, id
+        db.Index('ix_place_category_id_id', 'category_id', 'id'),
+        db.Index('ix_place_category_name', 'category_id', 'name', 'id'),
+        # Upsert key for imported / live OSM elements
+        db.Index('ux_place_osm', 'osm_type', 'osm_id', unique=True),
+        # Upsert/dedup key for seeded and Nominatim-ingested places
+        db.Index('ux_place_category_name_key', 'category_id', 'name_key', unique=True,
+                 sqlite_where=text('osm_id IS NULL'), postgresql_where=text('osm_id IS NULL')),
+    )
+
+    # Joined eagerly: to_dict() always needs the category name
+    category = db.relationship('Category', backref=db.backref('places', lazy=True), lazy='joined')
 
     def to_dict(self):
         return {
@@ -52,6 +89,114 @@ class Place(db.Model):
             'rating': self.rating
         }
 
+def _place_columns():
+    return {
+        'id':            Place.id,
+        'category_id':   Place.category_id,
+        'category_name': Category.name.label('category_name'),
+        'name':          Place.name,
+        'description':   Place.description,
+        'price_fee':     Place.price_fee,
+        'crowd_level':   Place.crowd_level,
+        'location':      Place.location,
+        'phone':         Place.phone,
+        'map_link':      Place.map_link,
+        'opening_hours': Place.opening_hours,
+        'image_url':     Place.image_url,
+        'latitude':      Place.latitude,
+        'longitude':     Place.longitude,
+        'rating':        Place.rating,
+    }
+
+
+PLACE_FIELDS = tuple(_place_columns())
+
+
+def place_projection(fields=None):
+    """
+    SELECT of the columns in Place.to_dict() (or just `fields`), with the
+    category name joined in. Add .where()/.order_by() and pass it to place_dicts().
+    """
+    columns = _place_columns()
+    wanted = fields or PLACE_FIELDS
+    return (
+        select(*(columns[f] for f in wanted))
+        .select_from(Place)
+        .join(Category, Place.category_id == Category.id)
+    )
+
+
+def place_dicts(stmt):
+    """Run a place_projection() query and return plain dicts, skipping ORM hydration."""
+    return [dict(row._mapping) for row in db.session.execute(stmt)]
+
+
+# Backs sort=rating (highest first, unrated last) in the category listings
+db.Index('ix_place_category_rating', Place.category_id,
+         func.coalesce(Place.rating, 0).desc(), Place.id.desc())
+
+# Slug lookups are case-insensitive (func.lower(Category.slug) == ...), which
+# the plain unique index on slug cannot serve
+db.Index('ix_category_slug_lower', func.lower(Category.slug))
+
+
+class ImportedRegion(db.Model):
+    """Bounding box of an offline OSM import; places inside it are served locally."""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    south = db.Column(db.Float, nullable=False)
+    west = db.Column(db.Float, nullable=False)
+    north = db.Column(db.Float, nullable=False)
+    east = db.Column(db.Float, nullable=False)
+    place_count = db.Column(db.Integer, nullable=False, default=0)
+    imported_at = db.Column(db.DateTime, nullable=False)
+
+    def contains(self, lat, lon):
+        return self.south <= lat <= self.north and self.west <= lon <= self.east
+
+
+class ReplicationState(db.Model):
+    """Last OSM replication diff applied by osm_replicate.py (single row)."""
+    id = db.Column(db.Integer, primary_key=True)
+    sequence = db.Column(db.BigInteger, nullable=False, default=0)
+    applied_at = db.Column(db.DateTime, nullable=True)
+
+
+class Job(db.Model):
+    """A background job (see jobs.py); persisted so queued work survives a restart."""
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')         # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)
+    message = db.Column(db.String(200), nullable=True)
+    result = db.Column(db.Text, nullable=True)                          # JSON
+    error = db.Column(db.Text, nullable=True)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'params': json.loads(self.params or '{}'),
+            'status': self.status,
+            'progress': self.progress,
+            'total': self.total,
+            'message': self.message,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'cancel_requested': self.cancel_requested,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -76,3 +221,7 @@ class User(db.Model):
             'avatar_url': self.avatar_url,
             'upi_id': self.upi_id
         }
+
+
+# Login/register compare func.lower(User.email)
+db.Index('ix_user_email_lower', func.lower(User.email))
@@ -0,0 +1,208 @@
+"""
+Bulk-import an offline OpenStreetMap extract into the Place table.
+
+    python osm_import.py tamil-nadu-latest.osm.pbf --region "Tamil Nadu"
+    python osm_import.py coimbatore.json          # Overpass [out:json] dump
+    python osm_import.py coimbatore.osm           # OSM XML
+
+The file is streamed element by element and written in batches, so memory
+stays flat even for a state-sized extract. Way centres need node positions:
+for .pbf they come from pyosmium's on-disk location index, for XML from a
+temporary SQLite table. Elements whose tags match a SLUG_CONFIG filter are
+upserted on (osm_type, osm_id) with their raw tags, and the covered bounding
+box is recorded as an ImportedRegion so /nearby-places and /places-by-city
+can answer from local data there.
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+from database import db
+from models import ImportedRegion
+from place_store import UPSERT_BATCH, classify, ensure_categories, osm_place_row, tag_matchers, \
+    upsert_osm_places, utcnow
+from spatial import spatial_index
+
+_WS = re.compile(r'[\s,]*')
+
+
+# ── readers: each yields Overpass-shaped element dicts ────────────────────────
+
+def iter_overpass_json(path, chunk_size=1 << 20):
+    """Stream the "elements" array of an Overpass JSON dump without loading the file."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as fh:
+        buf = ''
+        while True:                       # find the start of the elements array
+            chunk = fh.read(chunk_size)
+            if not chunk:
+                return
+            buf += chunk
+            key = buf.find('"elements"')
+            start = buf.find('[', key) if key != -1 else -1
+            if start != -1:
+                pos = start + 1
+                break
+            if key == -1:
+                buf = buf[-16:]
+
+        while True:
+            pos = _WS.match(buf, pos).end()
+            if buf.startswith(']', pos):
+                return
+            try:
+                obj, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                chunk = fh.read(chunk_size)
+                if not chunk:
+                    raise
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            yield obj
+            if pos > chunk_size:
+                buf, pos = buf[pos:], 0
+
+
+def iter_osm_xml(path):
+    """Stream nodes and ways from OSM XML; way centres are averaged from their nodes."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = sqlite3.connect(os.path.join(tmp, 'nodes.db'))
+        store.execute("CREATE TABLE nodes (id INTEGER PRIMARY KEY, lat REAL, lon REAL)")
+        pending_nodes = []
+
+        def flush_nodes():
+            store.executemany("INSERT OR REPLACE INTO nodes VALUES (?, ?, ?)", pending_nodes)
+            pending_nodes.clear()
+
+        context = ET.iterparse(path, events=('start', 'end'))
+        _, root = next(context)
+        for event, elem in context:
+            if event != 'end' or elem.tag not in ('node', 'way', 'relation'):
+                continue
+            tags = {t.get('k'): t.get('v') for t in elem.iter('tag')}
+            osm_id = int(elem.get('id'))
+
+            if elem.tag == 'node' and elem.get('lat') is not None:
+                lat, lon = float(elem.get('lat')), float(elem.get('lon'))
+                pending_nodes.append((osm_id, lat, lon))
+                if len(pending_nodes) >= 50000:
+                    flush_nodes()
+                if tags:
+                    yield {'type': 'node', 'id': osm_id, 'lat': lat, 'lon': lon, 'tags': tags}
+
+            elif elem.tag == 'way' and tags:
+                center = elem.find('center')
+                if center is not None:
+                    lat, lon = float(center.get('lat')), float(center.get('lon'))
+                else:
+                    if pending_nodes:
+                        flush_nodes()
+                    refs = [int(nd.get('ref')) for nd in elem.iter('nd')]
+                    marks = ','.join('?' * len(refs))
+                    lat, lon = store.execute(
+                        f"SELECT AVG(lat), AVG(lon) FROM nodes WHERE id IN ({marks})", refs
+                    ).fetchone() if refs else (None, None)
+                if lat is not None:
+                    yield {'type': 'way', 'id': osm_id, 'center': {'lat': lat, 'lon': lon}, 'tags': tags}
+
+            root.clear()          # drop parsed elements so memory stays flat
+        store.close()
+
+
+def iter_pbf(path):
+    """Stream tagged nodes and ways from a .osm.pbf with pyosmium (optional dependency)."""
+    try:
+        import osmium
+    except ImportError:
+        raise SystemExit("Reading .osm.pbf needs pyosmium:  pip install osmium")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        locations = 'sparse_file_array,' + os.path.join(tmp, 'locations.bin')
+        processor = osmium.FileProcessor(path, osmium.osm.NODE | osmium.osm.WAY).with_locations(locations)
+        for obj in processor:
+            if 'name' not in obj.tags and 'brand' not in obj.tags:
+                continue
+            tags = {t.k: t.v for t in obj.tags}
+            if obj.is_node():
+                if obj.location.valid():
+                    yield {'type': 'node', 'id': obj.id, 'lat': obj.location.lat,
+                           'lon': obj.location.lon, 'tags': tags}
+            else:
+                points = [(n.location.lat, n.location.lon) for n in obj.nodes if n.location.valid()]
+                if points:
+                    yield {'type': 'way', 'id': obj.id, 'tags': tags,
+                           'center': {'lat': sum(p[0] for p in points) / len(points),
+                                      'lon': sum(p[1] for p in points) / len(points)}}
+
+
+def iter_elements(path):
+    if path.endswith('.pbf'):
+        return iter_pbf(path)
+    if path.endswith('.json'):
+        return iter_overpass_json(path)
+    return iter_osm_xml(path)
+
+
+# ── import ────────────────────────────────────────────────────────────────────
+
+def import_extract(path, region_name=None, batch_size=UPSERT_BATCH):
+    """Stream `path` into Place. Must run inside an app context. Returns rows written."""
+    matchers = tag_matchers()
+    categories = ensure_categories()
+    seen_at = utcnow()
+    started = time.time()
+
+    batch, written, scanned = [], 0, 0
+    south, west, north, east = 90.0, 180.0, -90.0, -180.0
+
+    for el in iter_elements(path):
+        scanned += 1
+        slug = classify(el.get('tags') or {}, matchers)
+        if not slug:
+            continue
+        row = osm_place_row(el, slug, categories[slug], 'osm_import', seen_at)
+        if row is None:
+            continue
+        batch.append(row)
+        south, north = min(south, row['latitude']), max(north, row['latitude'])
+        west, east = min(west, row['longitude']), max(east, row['longitude'])
+
+        if len(batch) >= batch_size:
+            written += upsert_osm_places(batch)
+            db.session.commit()
+            batch = []
+            print(f"[osm_import] {scanned} scanned, {written} places written "
+                  f"({time.time() - started:.0f}s)")
+
+    if batch:
+        written += upsert_osm_places(batch)
+
+    if written:
+        db.session.add(ImportedRegion(
+            name=region_name or os.path.basename(path),
+            south=south, west=west, north=north, east=east,
+            place_count=written, imported_at=seen_at,
+        ))
+    db.session.commit()
+    spatial_index.rebuild(db.session)
+
+    print(f"[osm_import] done: {scanned} elements scanned, {written} places written "
+          f"in {time.time() - started:.0f}s")
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('path', help='.osm.pbf, OSM XML, or Overpass JSON dump')
+    parser.add_argument('--region', help='name to record for the imported area')
+    parser.add_argument('--batch', type=int, default=UPSERT_BATCH, help='rows per insert batch')
+    args = parser.parse_args()
+
+    from app import create_app
+    with create_app().app_context():
+        import_extract(args.path, args.region, args.batch)
@@ -0,0 +1,206 @@
+"""
+Keep imported places current by applying OSM replication diffs.
+
+    python osm_replicate.py /data/replication/minute            # apply what's new
+    python osm_replicate.py /data/replication/minute --loop 60  # keep polling
+
+The directory holds osmChange files (.osc or .osc.gz) in the usual
+replication layout (000/123/456.osc.gz) or as flat numbered files; the
+sequence number is read from the path. Files newer than the stored
+ReplicationState sequence are applied in order:
+
+- create/modify of a tagged node or way upserts it on (osm_type, osm_id),
+  picking up moves and tag changes; new elements are only added inside an
+  ImportedRegion;
+- delete, or a modify whose tags no longer match SLUG_CONFIG, removes it
+  if it is stored.
+
+Each file's changes and its sequence number are committed in one
+transaction, so a crash neither skips nor replays a diff. The B-tree indexes
+on place (name, category, osm key) are maintained by the database itself.
+This runs in its own process: the API servers' spatial indexes pick the
+changes up at their next periodic rebuild (SPATIAL_REFRESH_SECONDS).
+Ways only get a new centre when the diff carries their nodes; otherwise the
+stored position is kept.
+"""
+import argparse
+import gzip
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+
+from sqlalchemy import delete, select
+
+from database import db
+from models import ImportedRegion, Place, ReplicationState
+from place_store import classify, ensure_categories, osm_place_row, tag_matchers, upsert_osm_places, utcnow
+
+_IN_CHUNK = 500
+
+
+def sequence_of(relpath):
+    """'000/123/456.osc.gz' -> 123456"""
+    stem = relpath.split('.', 1)[0]
+    return int(''.join(re.findall(r'\d+', stem)) or 0)
+
+
+def pending_files(diff_dir, after_sequence):
+    """[(sequence, path)] for change files newer than after_sequence, oldest first."""
+    found = []
+    for root, _, files in os.walk(diff_dir):
+        for name in files:
+            if name.endswith(('.osc', '.osc.gz')):
+                path = os.path.join(root, name)
+                seq = sequence_of(os.path.relpath(path, diff_dir))
+                if seq > after_sequence:
+                    found.append((seq, path))
+    return sorted(found)
+
+
+def _read_changes(path, matchers):
+    """
+    Parse one osmChange file into ({key: (element, slug)}, {keys to delete}).
+    Later actions on the same element win.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    node_coords = {}
+    upserts, deletes = {}, set()
+    action = None
+
+    with opener(path, 'rb') as fh:
+        for event, elem in ET.iterparse(fh, events=('start', 'end')):
+            if event == 'start':
+                if elem.tag in ('create', 'modify', 'delete'):
+                    action = elem.tag
+                continue
+            if elem.tag not in ('node', 'way'):
+                continue
+
+            key = (elem.tag, int(elem.get('id')))
+            if action == 'delete' or elem.get('visible') == 'false':
+                upserts.pop(key, None)
+                deletes.add(key)
+                elem.clear()
+                continue
+
+            tags = {t.get('k'): t.get('v') for t in elem.iter('tag')}
+            el = {'type': key[0], 'id': key[1], 'tags': tags}
+            if key[0] == 'node':
+                el['lat'], el['lon'] = float(elem.get('lat')), float(elem.get('lon'))
+                node_coords[key[1]] = (el['lat'], el['lon'])
+            else:
+                points = [node_coords[int(nd.get('ref'))] for nd in elem.iter('nd')
+                          if int(nd.get('ref')) in node_coords]
+                if points:
+                    el['center'] = {'lat': sum(p[0] for p in points) / len(points),
+                                    'lon': sum(p[1] for p in points) / len(points)}
+            elem.clear()
+
+            slug = classify(tags, matchers) if tags else None
+            if slug:
+                upserts[key] = (el, slug)
+                deletes.discard(key)
+            else:
+                upserts.pop(key, None)
+                deletes.add(key)
+    return upserts, deletes
+
+
+def _existing(keys):
+    """{(osm_type, osm_id): (lat, lon)} for keys already stored."""
+    found = {}
+    by_type = {}
+    for osm_type, osm_id in keys:
+        by_type.setdefault(osm_type, []).append(osm_id)
+    for osm_type, ids in by_type.items():
+        for start in range(0, len(ids), _IN_CHUNK):
+            rows = db.session.execute(
+                select(Place.osm_id, Place.latitude, Place.longitude)
+                .where(Place.osm_type == osm_type, Place.osm_id.in_(ids[start:start + _IN_CHUNK]))
+            )
+            for osm_id, lat, lon in rows:
+                found[(osm_type, osm_id)] = (lat, lon)
+    return found
+
+
+def apply_change_file(path, matchers, categories, regions):
+    """Apply one osmChange file inside the current transaction; the caller commits. Returns (upserted, deleted)."""
+    upserts, deletes = _read_changes(path, matchers)
+    existing = _existing(list(upserts) + list(deletes))
+    seen_at = utcnow()
+
+    rows = []
+    for key, (el, slug) in upserts.items():
+        if 'lat' not in el and 'center' not in el:
+            if key not in existing:
+                continue                      # new way without node positions: can't place it
+            lat, lon = existing[key]
+            el['center'] = {'lat': lat, 'lon': lon}
+        lat = el.get('lat', el.get('center', {}).get('lat'))
+        lon = el.get('lon', el.get('center', {}).get('lon'))
+        if key not in existing and not any(r.contains(lat, lon) for r in regions):
+            continue                          # outside every imported area
+        row = osm_place_row(el, slug, categories[slug], 'osm_import', seen_at)
+        if row:
+            rows.append(row)
+    upserted = upsert_osm_places(rows)
+
+    # Most deletes are edits to untagged nodes that were never stored
+    deleted = 0
+    by_type = {}
+    for osm_type, osm_id in deletes:
+        if (osm_type, osm_id) in existing:
+            by_type.setdefault(osm_type, []).append(osm_id)
+    for osm_type, ids in by_type.items():
+        for start in range(0, len(ids), _IN_CHUNK):
+            deleted += db.session.execute(
+                delete(Place)
+                .where(Place.osm_type == osm_type, Place.osm_id.in_(ids[start:start + _IN_CHUNK]))
+            ).rowcount
+    return upserted, deleted
+
+
+def replicate(diff_dir):
+    """Apply every pending change file in order. Must run inside an app context."""
+    state = db.session.get(ReplicationState, 1)
+    if state is None:
+        state = ReplicationState(id=1, sequence=0)
+        db.session.add(state)
+        db.session.commit()
+
+    matchers = tag_matchers()
+    categories = ensure_categories()
+    regions = ImportedRegion.query.all()
+
+    files = pending_files(diff_dir, state.sequence)
+    for seq, path in files:
+        started = time.time()
+        try:
+            upserted, deleted = apply_change_file(path, matchers, categories, regions)
+            state.sequence = seq
+            state.applied_at = utcnow()
+            db.session.commit()           # the changes and the sequence number together
+        except Exception:
+            db.session.rollback()
+            raise
+        print(f"[osm_replicate] #{seq}: {upserted} upserted, {deleted} deleted "
+              f"({time.time() - started:.2f}s)")
+    return len(files)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('diff_dir', help='directory of .osc / .osc.gz replication files')
+    parser.add_argument('--loop', type=float, metavar='SECONDS',
+                        help='keep polling for new files every SECONDS')
+    args = parser.parse_args()
+
+    from app import create_app
+    with create_app(background=False).app_context():
+        while True:
+            applied = replicate(args.diff_dir)
+            if not args.loop:
+                break
+            if not applied:
+                time.sleep(args.loop)
@@ -1,10 +1,9 @@
 from flask import Flask, jsonify, request
-import requests
+import upstream
+from endpoints import overpass_pool
 
 app = Flask(__name__)
 
-OVERPASS_URL = "https://overpass-api.de/api/interpreter"
-
 @app.route("/")
 def home():
     return "Overpass API backend is running!"
@@ -29,7 +28,7 @@ def get_places():
     out;
     """
 
-    response = requests.get(OVERPASS_URL, params={'data': query})
+    response = upstream.hedged_get(overpass_pool, params={'data': query}, timeout=25)
     data = response.json()
 
     return jsonify(data)
@@ -0,0 +1,254 @@
+"""
+Batched writes of OpenStreetMap elements into the Place table.
+
+Elements are mapped through SLUG_CONFIG (the same tag filters the live
+Overpass search uses) and upserted on (osm_type, osm_id) with a single
+INSERT ... ON CONFLICT per batch. LiveWriter does the same for places the
+live endpoints have just fetched, on a background thread, but never
+overwrites an imported row: it only refreshes its last_seen and tags.
+Places without an OSM key (seed data, /fetch-data ingestion) go through
+insert_places(), keyed on (category_id, normalized name).
+"""
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import case
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import db
+from models import Category, Place, normalize_name
+
+UPSERT_BATCH = 500   # rows per statement; keeps SQLite under its bound-parameter limit
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def tag_matchers():
+    """[(key, value, slug)] for every tag filter in SLUG_CONFIG, in config order."""
+    from routes import SLUG_CONFIG, _TAG_FILTER
+    matchers = []
+    for slug, (_, osm_tag, _) in SLUG_CONFIG.items():
+        for tag_filter in osm_tag.split('|'):
+            m = _TAG_FILTER.fullmatch(tag_filter)
+            if m:
+                matchers.append((m.group(1), m.group(2), slug))
+    return matchers
+
+
+def classify(tags, matchers):
+    """The first slug whose tag filter matches, or None."""
+    for key, value, slug in matchers:
+        if tags.get(key) == value:
+            return slug
+    return None
+
+
+def ensure_categories():
+    """Create a Category for any SLUG_CONFIG slug that lacks one. Returns {slug: id}."""
+    from routes import SLUG_CONFIG
+    existing = {c.slug: c.id for c in Category.query.all()}
+    for slug, (_, _, label) in SLUG_CONFIG.items():
+        if slug not in existing:
+            cat = Category(name=f"{label}s", slug=slug)
+            db.session.add(cat)
+            db.session.flush()
+            existing[slug] = cat.id
+    db.session.commit()
+    return existing
+
+
+def osm_place_row(el, slug, category_id, source, seen_at=None):
+    """
+    Map an Overpass-shaped element ({type, id, lat/lon or center, tags}) to
+    Place column values, using the same field rules as the live endpoints.
+    Returns None for unnamed or unlocated elements.
+    """
+    from routes import SLUG_CONFIG, _parse_overpass, _element_coords
+    if _element_coords(el)[0] is None:
+        return None
+    parsed = _parse_overpass([el], SLUG_CONFIG[slug][2], None, None)
+    if not parsed:
+        return None
+    return place_row(parsed[0], category_id, source, el['type'], el['id'], el.get('tags'), seen_at)
+
+
+def place_row(p, category_id, source, osm_type, osm_id, tags, seen_at=None):
+    """Place column values from a place dict as built by routes._build_place()."""
+    return {
+        'category_id':   category_id,
+        'name':          p['name'][:200],
+        'name_key':      normalize_name(p['name']),
+        'description':   p['description'],
+        'location':      (p['location'] or '')[:200],
+        'phone':         (p['phone'] or '')[:50],
+        'opening_hours': (p['opening_hours'] or '')[:200],
+        'price_fee':     (p['price_fee'] or '')[:100],
+        'crowd_level':   p['crowd_level'],
+        'latitude':      p['latitude'],
+        'longitude':     p['longitude'],
+        'rating':        p['rating'],
+        'map_link':      p['map_link'],
+        'image_url':     p['image_url'],
+        'source':        source,
+        'osm_type':      osm_type,
+        'osm_id':        int(osm_id),
+        'tags':          json.dumps(tags or {}, ensure_ascii=False),
+        'last_seen':     seen_at or utcnow(),
+    }
+
+
+def _insert(table):
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+# Columns a live sighting may update on a row that came from an import
+_LIVE_REFRESH = ('last_seen', 'tags')
+
+
+def upsert_osm_places(rows, overwrite=True):
+    """
+    Insert-or-update rows keyed on (osm_type, osm_id), one statement per
+    UPSERT_BATCH rows. Duplicate keys within `rows` keep the last copy.
+    With overwrite=False (live write-through) an existing row that isn't
+    itself source='live' only gets its last_seen and tags updated.
+    The caller commits. Returns the number of rows written.
+    """
+    table = Place.__table__
+    unique = list({(r['osm_type'], r['osm_id']): r for r in rows}.values())
+    for start in range(0, len(unique), UPSERT_BATCH):
+        chunk = unique[start:start + UPSERT_BATCH]
+        stmt = _insert(table).values(chunk)
+        columns = [col for col in chunk[0] if col not in ('osm_type', 'osm_id')]
+        if overwrite:
+            set_ = {col: stmt.excluded[col] for col in columns}
+        else:
+            is_live = table.c.source == 'live'
+            set_ = {col: stmt.excluded[col] if col in _LIVE_REFRESH
+                    else case((is_live, stmt.excluded[col]), else_=table.c[col])
+                    for col in columns}
+        stmt = stmt.on_conflict_do_update(index_elements=['osm_type', 'osm_id'], set_=set_)
+        db.session.execute(stmt)
+    return len(unique)
+
+
+def _uniform(rows):
+    """Give every row the same keys (multi-row VALUES needs it); missing ones become NULL."""
+    columns = {}
+    for row in rows:
+        columns.update(dict.fromkeys(row))
+    return [{col: row.get(col) for col in columns} for row in rows]
+
+
+def upsert_categories(rows):
+    """Insert categories whose slug is new, in one statement. Returns {slug: id} for all categories."""
+    if rows:
+        stmt = _insert(Category.__table__).values(_uniform(rows))
+        db.session.execute(stmt.on_conflict_do_nothing(index_elements=['slug']))
+    return {c.slug: c.id for c in Category.query.all()}
+
+
+def insert_places(rows):
+    """
+    Insert places that have no OSM key, skipping any whose (category_id,
+    normalized name) already exists, one statement per UPSERT_BATCH rows.
+    Safe against concurrent ingests: the unique index decides, not a prior
+    SELECT. The caller commits. Returns the number of rows actually inserted.
+    """
+    unique = {}
+    for row in rows:
+        key = normalize_name(row['name'])
+        unique.setdefault((row['category_id'], key), dict(row, name_key=key))
+    unique = _uniform(list(unique.values()))
+
+    inserted = 0
+    for start in range(0, len(unique), UPSERT_BATCH):
+        stmt = _insert(Place.__table__).values(unique[start:start + UPSERT_BATCH])
+        stmt = stmt.on_conflict_do_nothing(
+            index_elements=['category_id', 'name_key'],
+            index_where=Place.osm_id.is_(None),
+        )
+        inserted += db.session.execute(stmt).rowcount
+    return inserted
+
+
+# ── write-through of live results ─────────────────────────────────────────────
+
+class LiveWriter:
+    """
+    Upserts places served by the live endpoints into Place, off the request
+    path: requests only enqueue, a daemon thread writes in batches. Inactive
+    (submit is a no-op) until start() is called with the Flask app. The rows
+    stay out of the spatial index: they are a detail fallback, not an
+    answer for /nearby-places.
+    """
+
+    def __init__(self, interval=2.0, max_queue=10000):
+        self.interval = interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._app = None
+        self._thread = None
+        self.written = 0
+        self.dropped = 0
+
+    def start(self, app):
+        if self._thread is None:
+            self._app = app
+            self._thread = threading.Thread(target=self._run, name='live-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, items):
+        """items: iterable of (place_dict, slug, raw_tags)."""
+        if self._thread is None:
+            return
+        for item in items:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < UPSERT_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            with self._app.app_context():
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"[live-writer] failed to store {len(batch)} places: {e}")
+
+    def _write(self, batch):
+        categories = ensure_categories()
+        seen_at = utcnow()
+        rows = []
+        for place, slug, tags in batch:
+            # Live IDs look like nom_node_123 / osm_way_456
+            _, osm_type, osm_id = place['id'].split('_', 2)
+            if place.get('latitude') is None or slug not in categories:
+                continue
+            rows.append(place_row(place, categories[slug], 'live', osm_type, osm_id, tags, seen_at))
+        written = upsert_osm_places(rows, overwrite=False)
+        db.session.commit()
+        self.written += written
+
+    def stats(self):
+        return {'queued': self._queue.qsize(), 'written': self.written, 'dropped': self.dropped}
+
+
+live_writer = LiveWriter(interval=float(os.environ.get('LIVE_WRITE_INTERVAL', 2.0)))
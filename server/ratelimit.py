@@ -0,0 +1,223 @@
+"""
+Per-host token-bucket governor for upstream APIs.
+
+Nominatim's usage policy allows at most 1 request per second, and Overpass
+and the OSRM demo server are similarly strict. Every outbound call takes a
+token for its host first. Waiters are served in priority order, so
+interactive searches overtake background ingestion (/fetch-data).
+
+Tokens are kept in memory by default (one bucket per worker process). Set
+RATE_LIMIT_DB to a SQLite path to share the buckets between workers.
+Threads call acquire(); coroutines on the async gateway call acquire_async()
+and share the same priority queue. acquire_async() never takes the queue's
+lock or touches the bucket (a SQLite write when shared) on the event loop:
+those steps run on a small helper pool, so a busy bucket can't stall every
+other request in flight on the loop.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+INTERACTIVE = 0
+BACKGROUND  = 1
+
+RATE_LIMIT_DB = os.environ.get('RATE_LIMIT_DB', '')
+MAX_WAIT      = float(os.environ.get('RATE_LIMIT_MAX_WAIT', 10))
+_ASYNC_POLL   = 0.05   # how often a queued coroutine re-checks whether it is at the head
+
+_async_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('RATE_LIMIT_ASYNC_THREADS', 4)),
+                                 thread_name_prefix='ratelimit')
+
+# host -> (requests per second, burst)
+HOST_LIMITS = {
+    'nominatim.openstreetmap.org': (float(os.environ.get('NOMINATIM_RATE', 1.0)), 1),
+    'overpass-api.de':             (float(os.environ.get('OVERPASS_RATE', 1.0)), 2),
+    'router.project-osrm.org':     (1.0, 1),
+    'api.open-meteo.com':          (10.0, 10),
+}
+
+
+class RateLimitTimeout(Exception):
+    """Raised when no token became available within the allowed wait."""
+
+
+class _MemoryBucket:
+    def __init__(self, rate, burst):
+        self.rate, self.burst = rate, burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def try_take(self):
+        """Take a token and return 0, or return the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _SQLiteBucket:
+    """Same bucket, stored in a SQLite row so every worker process draws from it."""
+
+    def __init__(self, host, rate, burst, path):
+        self.host, self.rate, self.burst = host, rate, burst
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (host TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+        )
+
+    def try_take(self):
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                "SELECT tokens, updated FROM buckets WHERE host = ?", (self.host,)
+            ).fetchone()
+            tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self.conn.execute(
+                "INSERT OR REPLACE INTO buckets (host, tokens, updated) VALUES (?, ?, ?)",
+                (self.host, tokens, now),
+            )
+            self.conn.execute("COMMIT")
+            return wait
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+
+class HostGovernor:
+    """Priority-ordered admission to one host's token bucket."""
+
+    def __init__(self, host, rate, burst, shared_path=RATE_LIMIT_DB):
+        self.host = host
+        self.bucket = _SQLiteBucket(host, rate, burst, shared_path) if shared_path else _MemoryBucket(rate, burst)
+        self._cond = threading.Condition()
+        self._queue = []                # heap of (priority, seq)
+        self._seq = itertools.count()
+        self.granted = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def acquire(self, priority=INTERACTIVE, max_wait=MAX_WAIT):
+        """Block until this caller may send a request. Returns the seconds waited."""
+        start = time.monotonic()
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    remaining = max_wait - (time.monotonic() - start)
+                    if self._queue[0] == ticket:
+                        wait = self.bucket.try_take()
+                        if wait == 0:
+                            break
+                    else:
+                        wait = remaining
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise RateLimitTimeout(f"No {self.host} slot within {max_wait:.1f}s")
+                    self._cond.wait(min(wait, remaining))
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+            return self._record(priority, start)
+
+    async def acquire_async(self, priority=INTERACTIVE, max_wait=MAX_WAIT):
+        """acquire() for coroutines: same queue and order, but sleeps instead of blocking a thread."""
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        ticket = (priority, next(self._seq))
+        await loop.run_in_executor(_async_pool, self._enqueue, ticket)
+        try:
+            while True:
+                remaining = max_wait - (time.monotonic() - start)
+                wait = _ASYNC_POLL
+                if self._queue[0] == ticket:     # unlocked peek; _take_if_head re-checks under the lock
+                    granted, wait = await loop.run_in_executor(
+                        _async_pool, self._take_if_head, ticket, priority, start)
+                    if granted:
+                        return time.monotonic() - start
+                    remaining = max_wait - (time.monotonic() - start)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise RateLimitTimeout(f"No {self.host} slot within {max_wait:.1f}s")
+                await asyncio.sleep(min(wait, _ASYNC_POLL, remaining))
+        finally:
+            await loop.run_in_executor(_async_pool, self._dequeue, ticket)
+
+    def _enqueue(self, ticket):
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+
+    def _dequeue(self, ticket):
+        with self._cond:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self._cond.notify_all()
+
+    def _take_if_head(self, ticket, priority, start):
+        """Take a token if `ticket` is first in line. Returns (granted, seconds before trying again)."""
+        with self._cond:
+            if self._queue[0] != ticket:
+                return False, _ASYNC_POLL
+            wait = self.bucket.try_take()
+            if wait == 0:
+                self._record(priority, start)
+                return True, 0.0
+            return False, wait
+
+    def _record(self, priority, start):
+        """Count a granted token (caller holds the condition). Returns the seconds waited."""
+        waited = time.monotonic() - start
+        self.granted[priority] = self.granted.get(priority, 0) + 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def stats(self):
+        with self._cond:
+            granted = sum(self.granted.values())
+            return {
+                'queue_depth':     len(self._queue),
+                'granted':         {'interactive': self.granted[INTERACTIVE],
+                                    'background':  self.granted[BACKGROUND]},
+                'timeouts':        self.timeouts,
+                'avg_wait_ms':     round(self.total_wait / granted * 1000, 1) if granted else 0.0,
+                'max_wait_ms':     round(self.max_wait * 1000, 1),
+            }
+
+
+_governors = {}
+_lock = threading.Lock()
+
+
+def governor_for(host):
+    """Return the governor for a host, or None if the host isn't rate limited."""
+    limits = HOST_LIMITS.get(host)
+    if limits is None:
+        return None
+    with _lock:
+        gov = _governors.get(host)
+        if gov is None:
+            gov = _governors[host] = HostGovernor(host, *limits)
+        return gov
+
+
+def stats():
+    with _lock:
+        return {host: gov.stats() for host, gov in _governors.items()}
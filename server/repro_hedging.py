@@ -0,0 +1,78 @@
+"""
+Tail latency with and without hedged requests, against local stand-in servers.
+
+    python repro_hedging.py                      # 2 stand-ins, one with a slow tail
+    python repro_hedging.py --requests 500 --slow-rate 0.2 --slow-ms 3000
+
+Each stand-in answers GET / with a tiny JSON body after `--base-ms`; the
+first one additionally stalls for `--slow-ms` on `--slow-rate` of requests,
+like an overloaded Overpass instance. The same request sequence is run
+through upstream.hedged_get() once with hedging off and once with it on,
+and the latency percentiles are printed side by side.
+"""
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import endpoints
+import upstream
+from endpoints import EndpointPool
+
+
+def stand_in(base_ms, slow_ms=0, slow_rate=0.0):
+    """Start a local server with injected latency; returns its URL."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            delay = base_ms + (slow_ms if random.random() < slow_rate else 0)
+            time.sleep(delay / 1000)
+            try:
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(b'{"elements": []}')
+            except (BrokenPipeError, ConnectionResetError):
+                pass                      # the hedge won and the client hung up
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def run(pool, n, hedge):
+    endpoints.HEDGE_REQUESTS = hedge
+    timings = []
+    for _ in range(n):
+        start = time.monotonic()
+        upstream.hedged_get(pool, '/', timeout=30).json()
+        timings.append((time.monotonic() - start) * 1000)
+    return sorted(timings)
+
+
+def pct(timings, p):
+    return timings[min(len(timings) - 1, int(len(timings) * p))]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--base-ms', type=float, default=20)
+    parser.add_argument('--slow-ms', type=float, default=2000)
+    parser.add_argument('--slow-rate', type=float, default=0.1)
+    args = parser.parse_args()
+
+    urls = [stand_in(args.base_ms, args.slow_ms, args.slow_rate), stand_in(args.base_ms)]
+    print(f"stand-ins: {urls[0]} (slow {args.slow_rate:.0%} of the time), {urls[1]}")
+
+    for hedge in (False, True):
+        pool = EndpointPool('stand-in', urls)
+        timings = run(pool, args.requests, hedge)
+        stats = pool.stats()
+        print(f"hedging {'on ' if hedge else 'off'}: p50 {pct(timings, 0.5):7.1f} ms   "
+              f"p95 {pct(timings, 0.95):7.1f} ms   p99 {pct(timings, 0.99):7.1f} ms   "
+              f"max {timings[-1]:7.1f} ms   hedged {stats['hedged']}, won {stats['hedge_wins']}")
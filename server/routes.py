@@ -1,12 +1,64 @@
 from flask import Blueprint, jsonify, request
-import requests
-from models import Category, Place, User
-from database import db
+import deadline
+import upstream
+import ratelimit
+import breaker
+from models import Category, ImportedRegion, Job, Place, User, PLACE_FIELDS, place_projection, place_dicts
+from database import db, use_replica
 from sqlalchemy import func
+from cache import upstream_cache, make_key, round_coord
+from endpoints import nominatim_pool, overpass_pool
+from gazetteer import gazetteer
+from singleflight import flight
+from spatial import spatial_index, haversine_km, MAX_RADIUS_KM
+from tiles import TILE_ZOOM, count_tiles, tile_for, tile_bbox, tiles_covering
+from place_store import insert_places, live_writer, utcnow
+from jobs import job_runner, QueueFull
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from datetime import timedelta
+import base64
+import json
+import math
+import os
+import re
+import threading
 import time
 
 api = Blueprint('api', __name__)
 
+_TAG_FILTER = re.compile(r'\["([^"]+)"="([^"]+)"\]')
+
+# places_by_city: 'parallel' fans out upstream calls, 'serial' keeps the old chain
+PLACES_BY_CITY_MODE  = os.environ.get('PLACES_BY_CITY_MODE', 'parallel').lower()
+CITY_SEARCH_DEADLINE = float(os.environ.get('CITY_SEARCH_DEADLINE', 20))   # its request budget
+SPARSE_THRESHOLD     = 5   # fewer named Nominatim hits than this triggers Overpass
+
+# /places/batch limits
+BATCH_MAX_IDS         = 100
+BATCH_OSM_CONCURRENCY = int(os.environ.get('BATCH_OSM_CONCURRENCY', 4))
+
+# Category listings
+PAGE_MAX_LIMIT = 500
+NO_DISTANCE    = 1e9   # sort key for places without coordinates
+
+# /nearby-places: categories whose local rows are kept ahead of live results
+LOCAL_FIRST_SLUGS  = set(filter(None, os.environ.get(
+    'LOCAL_FIRST_SLUGS', 'emergency,bus-timings,trains,flights').split(',')))
+LOCAL_NEARBY_LIMIT = 100
+NEARBY_LIVE_MAX_KM = float(os.environ.get('NEARBY_LIVE_MAX_KM', 25))   # Overpass radius cap
+
+# Imported OSM rows answer detail lookups while seen within this long
+LIVE_FRESH_SECONDS = float(os.environ.get('LIVE_FRESH_SECONDS', 7 * 86400))
+
+# Overpass: boxes covering more tiles than this skip the tile cache and send
+# one bbox query; every query caps its output
+OVERPASS_MAX_TILES  = int(os.environ.get('OVERPASS_MAX_TILES', 64))
+OVERPASS_CELL_LIMIT = int(os.environ.get('OVERPASS_CELL_LIMIT', 500))   # elements per (tile, tag)
+OVERPASS_BBOX_LIMIT = int(os.environ.get('OVERPASS_BBOX_LIMIT', 200))
+
+_fanout_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('FANOUT_WORKERS', 16)),
+                                  thread_name_prefix='fanout')
+
 def _add_bus_realtime(places, slug):
     """Add simulated real-time bus data if slug is bus-timings."""
     if slug.lower() != 'bus-timings':
@@ -27,155 +79,435 @@ def _add_bus_realtime(places, slug):
     return places
 
 @api.route('/categories', methods=['GET'])
+@use_replica
 def get_categories():
     categories = Category.query.all()
     return jsonify([c.to_dict() for c in categories])
 
 @api.route('/categories/<int:category_id>/places', methods=['GET'])
+@use_replica
 def get_places_by_category(category_id):
-    places = Place.query.filter_by(category_id=category_id).all()
-    return jsonify([p.to_dict() for p in places])
+    try:
+        results, next_cursor = _list_category_places(category_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return _page_response(results, next_cursor)
 
 @api.route('/categories/<string:slug>/places', methods=['GET'])
+@use_replica
 def get_places_by_slug(slug):
     """Fetch places by category text slug (e.g. 'restaurants', 'car-rentals')."""
     cat = Category.query.filter(func.lower(Category.slug) == func.lower(slug)).first_or_404()
-    places = Place.query.filter_by(category_id=cat.id).all()
-    results = [p.to_dict() for p in places]
-    return jsonify(_add_bus_realtime(results, slug))
+    try:
+        results, next_cursor = _list_category_places(cat.id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return _page_response(_add_bus_realtime(results, slug), next_cursor)
+
+
+# ── category listing: pagination / projection / sorting ──────────────────────
+
+def _encode_cursor(value, place_id):
+    raw = json.dumps([value, place_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    try:
+        value, place_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return value, int(place_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _list_category_places(category_id):
+    """
+    Shared body of the category listing endpoints. All query params are
+    optional; without them the whole category comes back in id order.
+      limit   page size (max PAGE_MAX_LIMIT); X-Next-Cursor carries the next page's cursor
+      after   cursor from the previous page (a plain place id when sorting by id)
+      fields  comma-separated subset of place fields (id is always included)
+      sort    id | name | rating (highest first) | distance (needs lat & lon)
+    Returns (rows, next_cursor). Raises ValueError for bad parameters.
+    """
+    args  = request.args
+    sort  = args.get('sort', 'id').lower()
+    limit = args.get('limit', type=int)
+    after = args.get('after')
+
+    fields = None
+    if args.get('fields'):
+        fields = [f.strip() for f in args['fields'].split(',') if f.strip()]
+        unknown = set(fields) - set(PLACE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        fields = ['id'] + [f for f in fields if f != 'id']
+
+    descending = False
+    if sort == 'id':
+        key = None
+    elif sort == 'name':
+        key = Place.name
+    elif sort == 'rating':
+        key, descending = func.coalesce(Place.rating, 0), True
+    elif sort == 'distance':
+        lat, lon = args.get('lat', type=float), args.get('lon', type=float)
+        if lat is None or lon is None:
+            raise ValueError("sort=distance needs lat and lon")
+        k = math.cos(math.radians(lat))   # squared equirectangular distance, in degrees²
+        key = func.coalesce(
+            (Place.latitude - lat) * (Place.latitude - lat)
+            + (Place.longitude - lon) * k * (Place.longitude - lon) * k,
+            NO_DISTANCE,
+        )
+    else:
+        raise ValueError(f"Unknown sort: {sort}")
+
+    # Live write-through rows back detail fallbacks; listings show curated data only
+    stmt = place_projection(fields).where(Place.category_id == category_id,
+                                          Place.source.is_distinct_from('live'))
+    if key is not None:
+        stmt = stmt.add_columns(key.label('sort_key'))
+
+    if after:
+        if key is None:
+            if not after.isdigit():
+                raise ValueError("Invalid cursor")
+            stmt = stmt.where(Place.id > int(after))
+        else:
+            value, last_id = _decode_cursor(after)
+            if descending:
+                stmt = stmt.where((key < value) | ((key == value) & (Place.id < last_id)))
+            else:
+                stmt = stmt.where((key > value) | ((key == value) & (Place.id > last_id)))
+
+    if key is None:
+        stmt = stmt.order_by(Place.id)
+    elif descending:
+        stmt = stmt.order_by(key.desc(), Place.id.desc())
+    else:
+        stmt = stmt.order_by(key, Place.id)
+
+    if limit is not None:
+        limit = max(1, min(limit, PAGE_MAX_LIMIT))
+        stmt = stmt.limit(limit + 1)
+
+    rows = place_dicts(stmt)
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = str(last['id']) if key is None else _encode_cursor(last['sort_key'], last['id'])
+
+    for row in rows:
+        sort_key = row.pop('sort_key', None)
+        if sort == 'distance':
+            row['distance_km'] = round(math.sqrt(sort_key) * 111.2, 2) if sort_key < NO_DISTANCE else None
+    return rows, next_cursor
+
+
+def _page_response(results, next_cursor):
+    resp = jsonify(results)
+    if next_cursor:
+        resp.headers['X-Next-Cursor'] = next_cursor
+    return resp
 
 @api.route('/places/<string:place_id>', methods=['GET'])
+@use_replica
+@deadline.budgeted('place_detail', 10)
 def get_place_detail(place_id):
     """
     Fetch place details.
     - If place_id is numeric, fetch from local DB.
-    - If place_id starts with 'nom_' or 'osm_', fetch live from OSM via Nominatim/Overpass.
+    - If place_id starts with 'nom_' or 'osm_', serve the imported copy when
+      it was seen recently, otherwise fetch live from OSM via Nominatim.
     """
     # 1. Try local database first if numeric
     if place_id.isdigit():
         place = Place.query.get_or_404(int(place_id))
         return jsonify(place.to_dict())
 
-    # 2. Try OSM fetching for 'nom_' or 'osm_' prefixes
+    # 2. OSM IDs: a fresh imported copy, else live
     if place_id.startswith(('nom_', 'osm_')):
+        stored = _stored_osm_places([place_id])
+        if place_id in stored:
+            return jsonify(stored[place_id])
         return _fetch_osm_detail_route(place_id)
 
     return jsonify({"error": "Invalid place ID format"}), 400
 
 
+@api.route('/places/batch', methods=['GET', 'POST'])
+@use_replica
+@deadline.budgeted('places_batch', 15)
+def get_places_batch():
+    """
+    Fetch details for many places in one call (used by Favorites).
+    POST {"ids": [...]} or GET ?ids=1,nom_node_123,...
+    Numeric IDs are resolved with a single DB query; OSM IDs are fetched
+    concurrently (at most BATCH_OSM_CONCURRENCY at a time).
+    Returns {"places": [...in request order...], "errors": {id: message}}.
+    """
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        ids = body.get('ids') if isinstance(body, dict) else None
+        if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+            return jsonify({"error": "ids must be a list of strings"}), 400
+    else:
+        ids = [i for i in request.args.get('ids', '').split(',') if i]
+    ids = list(dict.fromkeys(i.strip() for i in ids))   # de-dupe, keep order
+
+    if len(ids) > BATCH_MAX_IDS:
+        return jsonify({"error": f"At most {BATCH_MAX_IDS} ids per request"}), 400
+
+    found, errors = {}, {}
+
+    numeric_ids = [int(i) for i in ids if i.isdigit()]
+    if numeric_ids:
+        for place in Place.query.filter(Place.id.in_(numeric_ids)).all():
+            found[str(place.id)] = place.to_dict()
+
+    osm_ids = [i for i in ids if i.startswith(('nom_', 'osm_'))]
+    if osm_ids:
+        found.update(_stored_osm_places(osm_ids))
+        osm_ids = [i for i in osm_ids if i not in found]
+    if osm_ids:
+        with ThreadPoolExecutor(max_workers=min(BATCH_OSM_CONCURRENCY, len(osm_ids))) as pool:
+            futures = {i: deadline.submit(pool, _cached_osm_detail, i) for i in osm_ids}
+            for place_id, future in futures.items():
+                try:
+                    found[place_id] = future.result()
+                except Exception as e:
+                    errors[place_id] = str(e)
+        if errors:
+            # Nominatim down or its breaker open: older stored copies beat errors
+            stale = _stored_osm_places(list(errors), max_age=None)
+            for place_id, row in stale.items():
+                found[place_id] = row
+                del errors[place_id]
+            if stale:
+                deadline.mark_partial()
+
+    for place_id in ids:
+        if place_id not in found and place_id not in errors:
+            errors[place_id] = "Not found" if place_id.isdigit() else "Invalid place ID format"
+
+    return jsonify({
+        'places': [found[i] for i in ids if i in found],
+        'errors': errors,
+    }), 200
+
+
+def _stored_osm_places(place_ids, max_age=LIVE_FRESH_SECONDS):
+    """
+    {place_id: dict} for nom_/osm_ IDs whose Place row was last seen within
+    max_age seconds. Rows written through from live search results only
+    carry what the list showed, so they are used only when max_age is None:
+    any stored copy, as a fallback while Nominatim is unavailable. The dicts
+    keep the requested ID so favourites match.
+    """
+    by_type = {}
+    for place_id in place_ids:
+        parts = place_id.split('_', 2)
+        if len(parts) == 3 and parts[2].isdigit():
+            by_type.setdefault(parts[1], {})[int(parts[2])] = place_id
+    if not by_type:
+        return {}
+
+    found = {}
+    for osm_type, wanted in by_type.items():
+        query = Place.query.filter(Place.osm_type == osm_type, Place.osm_id.in_(list(wanted)))
+        if max_age is not None:
+            query = query.filter(Place.last_seen >= utcnow() - timedelta(seconds=max_age),
+                                 Place.source.is_distinct_from('live'))
+        rows = query.all()
+        for place in rows:
+            row = place.to_dict()
+            row['id'] = wanted[place.osm_id]
+            row['from_osm'] = True
+            found[row['id']] = row
+    return found
+
+
 def _fetch_osm_detail_route(place_id):
     """Internal helper to fetch rich details from OSM for a given nomad/osm ID."""
     try:
-        # ID format: nom_node_12345 or osm_way_67890
-        parts = place_id.split('_')
-        if len(parts) < 3:
-            return jsonify({"error": "Invalid OSM ID format"}), 400
-        
-        osm_type_char = parts[1][0] # 'n', 'w', 'r'
-        osm_id = parts[2]
-        
-        # We use Nominatim to get the most detailed tags
-        osm_type_full = {'n': 'N', 'w': 'W', 'r': 'R'}.get(osm_type_char, 'N')
-        url = "https://nominatim.openstreetmap.org/details"
-        params = {
-            'osmtype': osm_type_full,
-            'osmid': osm_id,
-            'format': 'json',
-            'addressdetails': 1,
-            'hierarchy': 1,
-        }
-        headers = {'User-Agent': 'TripPlannerApp/1.0'}
-        
-        resp = requests.get(url, params=params, headers=headers, timeout=15)
-        if resp.status_code != 200:
-            return jsonify({"error": "Failed to fetch from OSM"}), 404
-            
-        data = resp.json()
-        tags = data.get('extratags', {})
-        
-        # Extract location/address properly from the address list
-        address_list = data.get('address', [])
-        addr_parts = []
-        for a in address_list:
-            # Skip high-level boundaries like country/state
-            if a.get('type') not in ['country', 'state', 'state_district', 'country_code']:
-                addr_parts.append(a.get('localname'))
-        
-        # Build a robust address string
-        location_str = ', '.join(addr_parts) if addr_parts else data.get('localname', 'Coimbatore, India')
-        
-        # Extract name
-        names = data.get('names', {})
-        name = names.get('name') or names.get('name:en') or data.get('localname', 'Unknown Place')
-        
-        # Extract phone, website, opening hours, etc.
-        # Broaden phone search: tags can be 'phone', 'contact:phone', 'phone:mobile', etc.
-        phone = (tags.get('phone') or 
-                 tags.get('contact:phone') or 
-                 tags.get('phone:mobile') or 
-                 tags.get('contact:mobile') or 
-                 'Contact details at location')
-        
-        opening = tags.get('opening_hours') or 'Open daily (Confirm on site)'
-        website = tags.get('website') or tags.get('contact:website') or tags.get('url') or ''
-        cuisine = tags.get('cuisine') or ''
-        
-        # Build description
-        desc_parts = []
-        if cuisine: desc_parts.append(f"Cuisine: {cuisine.replace(';', ', ').title()}")
-        if website: desc_parts.append(f"Website: {website}")
-        city_name = next((a.get('localname') for a in address_list if a.get('type') in ['city', 'town', 'village']), 'Coimbatore')
-        description = '. '.join(desc_parts) if desc_parts else f"Real establishment in {city_name}, sourced from OpenStreetMap."
-        
-        # Latitude/Longitude - Nominatim Details has centroid
-        centroid = data.get('centroid', {})
-        coords = centroid.get('coordinates', [0.0, 0.0])
-        lat = coords[1]
-        lon = coords[0]
-
-        # Rating simulation logic (OSM has no ratings, so we use a stable one)
-        import hashlib
-        rating_seed = int(hashlib.md5(place_id.encode()).hexdigest(), 16)
-        import random
-        random.seed(rating_seed)
-        fake_rating = round(random.uniform(4.0, 4.9), 1)
-
-        result = {
-            'id': place_id,
-            'name': name,
-            'description': description,
-            'location': location_str,
-            'phone': phone,
-            'opening_hours': opening,
-            'latitude': lat,
-            'longitude': lon,
-            'rating': fake_rating,
-            'crowd_level': 'Moderate',
-            'price_fee': tags.get('fee', 'See location'),
-            'image_url': f"https://source.unsplash.com/800x600/?{name.replace(' ', ',')},building",
-            'map_link': f"https://www.openstreetmap.org/?mlat={lat}&mlon={lon}",
-            'category_name': 'Live Result',
-            'from_osm': True,
-        }
-        return jsonify(result)
-        
+        return jsonify(_cached_osm_detail(place_id))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
         print(f"[fetch_osm_detail_route] Error: {e}")
+        # Nominatim down or its breaker open: an older stored copy beats an error
+        stored = _stored_osm_places([place_id], max_age=None)
+        if place_id in stored:
+            deadline.mark_partial()
+            return jsonify(stored[place_id])
         return jsonify({"error": str(e)}), 500
 
 
+def _cached_osm_detail(place_id):
+    """
+    Stale-while-revalidate wrapper around _fetch_osm_detail.
+    A cached copy is returned immediately; if it has expired, a background
+    refresh is started and the stale copy keeps being served until it lands
+    (or indefinitely within the stale window, if Nominatim keeps failing).
+    """
+    cached, fresh = upstream_cache.lookup('osm_detail', place_id)
+    if cached is not None:
+        if not fresh:
+            _refresh_osm_detail(place_id)
+        return cached
+
+    def fetch():
+        cached, _ = upstream_cache.lookup('osm_detail', place_id, count=False)
+        if cached is not None:
+            return cached
+        result = _fetch_osm_detail(place_id)
+        upstream_cache.set('osm_detail', place_id, result)
+        return result
+
+    return flight.do(f"osm_detail|{place_id}", fetch)
+
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def _refresh_osm_detail(place_id):
+    """Re-fetch a detail entry off the request path. At most one refresh per ID at a time."""
+    with _refreshing_lock:
+        if place_id in _refreshing:
+            return
+        _refreshing.add(place_id)
+
+    def refresh():
+        try:
+            upstream_cache.set('osm_detail', place_id,
+                               _fetch_osm_detail(place_id, priority=ratelimit.BACKGROUND))
+        except Exception as e:
+            print(f"[osm_detail refresh] {place_id}: {e} (keeping stale copy)")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(place_id)
+
+    _fanout_pool.submit(refresh)
+
+
+def _fetch_osm_detail(place_id, priority=ratelimit.INTERACTIVE):
+    """
+    Build the place dict for a nom_/osm_ ID from Nominatim /details.
+    Raises ValueError for a malformed ID and LookupError if OSM has no answer.
+    Background refreshes pass priority=BACKGROUND so they yield to users.
+    """
+    # ID format: nom_node_12345 or osm_way_67890
+    parts = place_id.split('_')
+    if len(parts) < 3:
+        raise ValueError("Invalid OSM ID format")
+
+    osm_type_char = parts[1][0] # 'n', 'w', 'r'
+    osm_id = parts[2]
+    
+    # We use Nominatim to get the most detailed tags
+    osm_type_full = {'n': 'N', 'w': 'W', 'r': 'R'}.get(osm_type_char, 'N')
+    params = {
+        'osmtype': osm_type_full,
+        'osmid': osm_id,
+        'format': 'json',
+        'addressdetails': 1,
+        'hierarchy': 1,
+    }
+    
+    resp = upstream.hedged_get(nominatim_pool, '/details', params=params, timeout=15, priority=priority)
+    if resp.status_code != 200:
+        raise LookupError("Failed to fetch from OSM")
+        
+    data = resp.json()
+    tags = data.get('extratags', {})
+    
+    # Extract location/address properly from the address list
+    address_list = data.get('address', [])
+    addr_parts = []
+    for a in address_list:
+        # Skip high-level boundaries like country/state
+        if a.get('type') not in ['country', 'state', 'state_district', 'country_code']:
+            addr_parts.append(a.get('localname'))
+    
+    # Build a robust address string
+    location_str = ', '.join(addr_parts) if addr_parts else data.get('localname', 'Coimbatore, India')
+    
+    # Extract name
+    names = data.get('names', {})
+    name = names.get('name') or names.get('name:en') or data.get('localname', 'Unknown Place')
+    
+    # Extract phone, website, opening hours, etc.
+    # Broaden phone search: tags can be 'phone', 'contact:phone', 'phone:mobile', etc.
+    phone = (tags.get('phone') or 
+             tags.get('contact:phone') or 
+             tags.get('phone:mobile') or 
+             tags.get('contact:mobile') or 
+             'Contact details at location')
+    
+    opening = tags.get('opening_hours') or 'Open daily (Confirm on site)'
+    website = tags.get('website') or tags.get('contact:website') or tags.get('url') or ''
+    cuisine = tags.get('cuisine') or ''
+    
+    # Build description
+    desc_parts = []
+    if cuisine: desc_parts.append(f"Cuisine: {cuisine.replace(';', ', ').title()}")
+    if website: desc_parts.append(f"Website: {website}")
+    city_name = next((a.get('localname') for a in address_list if a.get('type') in ['city', 'town', 'village']), 'Coimbatore')
+    description = '. '.join(desc_parts) if desc_parts else f"Real establishment in {city_name}, sourced from OpenStreetMap."
+    
+    # Latitude/Longitude - Nominatim Details has centroid
+    centroid = data.get('centroid', {})
+    coords = centroid.get('coordinates', [0.0, 0.0])
+    lat = coords[1]
+    lon = coords[0]
+
+    # Rating simulation logic (OSM has no ratings, so we use a stable one)
+    import hashlib
+    rating_seed = int(hashlib.md5(place_id.encode()).hexdigest(), 16)
+    import random
+    random.seed(rating_seed)
+    fake_rating = round(random.uniform(4.0, 4.9), 1)
+
+    result = {
+        'id': place_id,
+        'name': name,
+        'description': description,
+        'location': location_str,
+        'phone': phone,
+        'opening_hours': opening,
+        'latitude': lat,
+        'longitude': lon,
+        'rating': fake_rating,
+        'crowd_level': 'Moderate',
+        'price_fee': tags.get('fee', 'See location'),
+        'image_url': f"https://source.unsplash.com/800x600/?{name.replace(' ', ',')},building",
+        'map_link': f"https://www.openstreetmap.org/?mlat={lat}&mlon={lon}",
+        'category_name': 'Live Result',
+        'from_osm': True,
+    }
+    return result
+
+
     # Old seed method replaced
     return jsonify({"message": "Deprecated. Use new logic."})
 
 
-def fetch_places_from_osm(location="Paris"):
+def fetch_places_from_osm(location="Paris", progress=None):
+    """
+    Pull a handful of places per category for `location` from Nominatim.
+    progress(done, total, message) is called before and after each category
+    (jobs.JobContext.progress, which may raise JobCancelled). Returns the count added.
+    """
     print(f"Fetching data for {location}...")
     cats = Category.query.all()
     count = 0
-    
-    # Simple rate limiting/header
-    headers = {'User-Agent': 'TripPlannerApp/1.0'}
-    
+
+    work = []
     for cat in cats:
         query = ""
         if "car" in cat.slug: query = "car rental"
@@ -184,9 +516,13 @@ def fetch_places_from_osm(location="Paris"):
         elif "tourist" in cat.slug: query = "tourist attraction"
         elif "hotel" in cat.slug: query = "hotel"
         
-        if not query: continue
-        
-        url = "https://nominatim.openstreetmap.org/search"
+        if query:
+            work.append((cat, query))
+
+    for done, (cat, query) in enumerate(work):
+        if progress:
+            progress(done, len(work), f"{query} in {location}")
+
         params = {
             'q': f"{query} in {location}",
             'format': 'json',
@@ -195,20 +531,16 @@ def fetch_places_from_osm(location="Paris"):
         }
         
         try:
-            response = requests.get(url, params=params, headers=headers)
+            response = upstream.hedged_get(nominatim_pool, '/search', params=params, priority=ratelimit.BACKGROUND)
             if response.status_code == 200:
                 results = response.json()
+                rows = []
                 for item in results:
-                    # Avoid duplicates by name + category
-                    if Place.query.filter_by(name=item.get('name'), category_id=cat.id).first():
-                        continue
-                        
                     lat = item.get('lat', '0')
                     lon = item.get('lon', '0')
-                    
-                    new_place = Place(
+                    rows.append(dict(
                         category_id=cat.id,
-                        name=item.get('name', 'Unknown Place'),
+                        name=item.get('name') or 'Unknown Place',
                         description=f"Type: {item.get('type', 'Unknown')}. {item.get('display_name', '')}",
                         price_fee="See Website",
                         crowd_level="Moderate",
@@ -218,22 +550,28 @@ def fetch_places_from_osm(location="Paris"):
                         opening_hours="09:00 - 18:00",
                         image_url=f"https://source.unsplash.com/400x300/?{query.replace(' ', ',')}",
                         latitude=float(lat) if lat else 0.0,
-                        longitude=float(lon) if lon else 0.0
-                    )
-                    # Hack: Store lat/lon in map_link or description if we don't have columns? 
-                    # Ideally we should add lat/lon columns. For now, I'll parse them from map_link or add them to description hiddenly or just rely on API for map.
-                    # Wait, the user wants to INTEGRATE the map. I need lat/lon.
-                    # I will add lat/lon columns to the model in the next step. 
-                    # For now let's stick to valid model fields.
-                    
-                    db.session.add(new_place)
-                    count += 1
+                        longitude=float(lon) if lon else 0.0,
+                        source='nominatim',
+                    ))
+                # One INSERT ... ON CONFLICT DO NOTHING; duplicates by name + category are skipped
+                count += insert_places(rows)
                 db.session.commit()
         except Exception as e:
             print(f"Error fetching {query}: {e}")
-            
+
+    if count:
+        spatial_index.rebuild(db.session)   # Core inserts bypass the ORM index hooks
+    if progress:
+        progress(len(work), len(work), f"added {count} places")
     return count
 
+
+def _fetch_data_job(ctx, location):
+    return {'location': location, 'added': fetch_places_from_osm(location, ctx.progress)}
+
+
+job_runner.register('fetch_data', _fetch_data_job)
+
 @api.route('/seed', methods=['POST'])
 def seed_db():
     # Make sure all required categories exist
@@ -310,11 +648,40 @@ def seed_db():
 
 @api.route('/fetch-data', methods=['POST'])
 def fetch_external_data():
-    location = request.json.get('location', 'Paris')
-    count = fetch_places_from_osm(location)
-    return jsonify({"message": f"Fetched {count} new places for {location}"})
+    """
+    Queue OSM ingestion for a location and return at once with a job id.
+    Poll GET /api/jobs/<id> for progress and the final count.
+    """
+    location = (request.get_json(silent=True) or {}).get('location', 'Paris')
+    try:
+        job = job_runner.submit('fetch_data', {'location': location})
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429
+    resp = jsonify({**job.to_dict(), "message": f"Fetching places for {location} in the background"})
+    resp.status_code = 202
+    resp.headers['Location'] = f"/api/jobs/{job.id}"
+    return resp
+
+
+@api.route('/jobs/<string:job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status and progress of a background job."""
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@api.route('/jobs/<string:job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued job, or ask a running one to stop at its next progress step."""
+    job = job_runner.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
 
 @api.route('/estimate-budget', methods=['POST'])
+@deadline.budgeted('estimate_budget', 8)
 def estimate_budget():
     data = request.json
     if not data:
@@ -337,15 +704,18 @@ def estimate_budget():
             coords_str = f"{origin_coords[0]},{origin_coords[1]};{dest_coords[0]},{dest_coords[1]}"
             osrm_url = f"http://router.project-osrm.org/route/v1/driving/{coords_str}?overview=false"
             
-            headers = {'User-Agent': 'TripPlannerApp/1.0'}
-            resp = requests.get(osrm_url, headers=headers, timeout=10)
-            if resp.status_code == 200:
-                osrm_data = resp.json()
-                if osrm_data.get('code') == 'Ok' and osrm_data.get('routes'):
-                    dist_meters = osrm_data['routes'][0]['distance']
-                    distance_km = dist_meters / 1000.0
-            else:
+            def fetch():
+                resp = upstream.get(osrm_url, timeout=10)
+                if resp.status_code == 200:
+                    return resp.json()
                 print(f"OSRM Error: {resp.status_code} - {resp.text}")
+                return None
+
+            # Route distances barely change, so a cached answer also covers OSRM outages
+            osrm_data = upstream_cache.get_or_fetch('osrm_route', make_key(coords_str), fetch)
+            if osrm_data and osrm_data.get('code') == 'Ok' and osrm_data.get('routes'):
+                dist_meters = osrm_data['routes'][0]['distance']
+                distance_km = dist_meters / 1000.0
         except Exception as e:
             print(f"Failed to fetch distance from OSRM: {e}")
             
@@ -510,6 +880,7 @@ def logout():
 
 # Overpass API endpoint for real-time place data (used by MapView)
 @api.route('/places', methods=['GET'])
+@deadline.budgeted('places', 15)
 def get_places_overpass():
     """
     Fetch real-time places from Overpass API based on coordinates and type.
@@ -532,22 +903,15 @@ def get_places_overpass():
         else:
             tag = '["tourism"="attraction"]'
         
-        lat_f = float(lat)
-        lon_f = float(lon)
+        lat_f = round_coord(lat)
+        lon_f = round_coord(lon)
         radius = 0.02
         
-        query = f"""
-        [out:json];
-        node{tag}({lat_f - radius},{lon_f - radius},{lat_f + radius},{lon_f + radius});
-        out;
-        """
-        
-        overpass_url = "https://overpass-api.de/api/interpreter"
-        response = requests.get(overpass_url, params={'data': query}, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            return jsonify(data), 200
+        elements, complete = _overpass_tiles(lat_f - radius, lon_f - radius,
+                                             lat_f + radius, lon_f + radius, [tag])
+        if elements or complete:
+            nodes = [el for el in elements if el['type'] == 'node']
+            return jsonify({"elements": nodes}), 200
         else:
             return jsonify({"error": "Failed to fetch data from Overpass API", "elements": []}), 500
             
@@ -557,6 +921,7 @@ def get_places_overpass():
 
 
 @api.route('/search-places', methods=['GET'])
+@deadline.budgeted('search_places', 10)
 def search_places():
     """
     Search for tourist attractions or generic places using Overpass API
@@ -569,9 +934,7 @@ def search_places():
 
     # We use Nominatim to search for the query, and Overpass for detailed fee tags.
     # To keep it fast, we can ping Nominatim directly, requesting `extratags`.
-    headers = {'User-Agent': 'TripPlannerApp/1.0'}
     try:
-        url = "https://nominatim.openstreetmap.org/search"
         params = {
             'q': query,
             'format': 'json',
@@ -579,12 +942,15 @@ def search_places():
             'addressdetails': 1,
             'extratags': 1
         }
-        resp = requests.get(url, params=params, headers=headers, timeout=10)
-        
-        if resp.status_code != 200:
+
+        def fetch():
+            resp = upstream.hedged_get(nominatim_pool, '/search', params=params, timeout=10)
+            return resp.json() if resp.status_code == 200 else None
+
+        results = upstream_cache.get_or_fetch('nominatim_search', make_key('extratags', query, 10), fetch)
+        if results is None:
             return jsonify({"error": "Search failed"}), 500
             
-        results = resp.json()
         places_data = []
         
         for item in results:
@@ -676,41 +1042,90 @@ def _nominatim_keyword_search(keyword, city, limit=40):
     Uses Nominatim's free-text search: "restaurant in Coimbatore"
     Returns actual NAMED establishments with addresses, phone numbers, etc.
     """
-    headers = {'User-Agent': 'TripPlannerApp/1.0 (trip-planner-app)'}
-    try:
-        resp = requests.get(
-            'https://nominatim.openstreetmap.org/search',
-            params={
-                'q':              f"{keyword} in {city}",
-                'format':         'json',
-                'limit':          limit,
-                'addressdetails': 1,
-                'extratags':      1,
-                'namedetails':    1,
-            },
-            headers=headers,
-            timeout=15,
-        )
-        if resp.status_code == 200:
-            return resp.json()
-    except Exception as e:
-        print(f"[Nominatim keyword] error: {e}")
-    return []
+    def fetch():
+        try:
+            resp = upstream.hedged_get(
+                nominatim_pool, '/search',
+                params={
+                    'q':              f"{keyword} in {city}",
+                    'format':         'json',
+                    'limit':          limit,
+                    'addressdetails': 1,
+                    'extratags':      1,
+                    'namedetails':    1,
+                },
+                timeout=15,
+            )
+            if resp.status_code == 200:
+                return resp.json()
+        except Exception as e:
+            print(f"[Nominatim keyword] error: {e}")
+        return None
 
+    key = make_key('keyword', keyword, city, limit)
+    return upstream_cache.get_or_fetch('nominatim_search', key, fetch) or []
 
-def _overpass_bounding_box(lat_f, lon_f, osm_tag, radius_km=8, limit=40):
+
+def _nominatim_geocode(query, limit=1):
+    """Raw Nominatim /search results for a place name, shared through the cache."""
+    def fetch():
+        try:
+            resp = upstream.hedged_get(
+                nominatim_pool, '/search',
+                params={'q': query, 'format': 'json', 'limit': limit},
+                timeout=10,
+            )
+            if resp.status_code == 200:
+                return resp.json()
+        except Exception as e:
+            print(f"[Nominatim geocode] error: {e}")
+        return None
+
+    key = make_key(query) if limit == 1 else make_key(query, limit)
+    return upstream_cache.get_or_fetch('nominatim_geocode', key, fetch) or []
+
+
+def _geocode_city(city):
+    """Resolve a city name to (lat, lon), from the local gazetteer or else Nominatim. None if not found."""
+    known = gazetteer.lookup(city)
+    if known:
+        return known['lat'], known['lon']
+    geo = _nominatim_geocode(city)
+    if not geo:
+        return None
+    return float(geo[0]['lat']), float(geo[0]['lon'])
+
+
+def _element_coords(el):
+    """(lat, lon) of an Overpass node, or the centre of a way/relation."""
+    if 'lat' in el:
+        return el['lat'], el['lon']
+    c = el.get('center') or {}
+    return c.get('lat'), c.get('lon')
+
+
+def _matches_filter(tag_filter, tags):
+    """True if an element's tags satisfy an Overpass filter like ["amenity"="restaurant"]."""
+    m = _TAG_FILTER.fullmatch(tag_filter)
+    return not m or tags.get(m.group(1)) == m.group(2)
+
+
+def _fetch_overpass_tiles(missing):
     """
-    Supplementary search using Overpass API bounding box.
-    Used when Nominatim returns < 5 named places.
+    Fetch several (tile, tag) cells in one Overpass query and split the
+    answer back per cell. Returns ({(tile, tag): elements}, truncated), or
+    (None, False) on failure. truncated means the output hit its limit, so
+    some cells may be missing elements.
     """
-    r = radius_km / 111.0
-    tags = osm_tag.split('|')
     statements = []
-    for tag in tags:
-        statements.append(f"  node{tag}({lat_f-r},{lon_f-r},{lat_f+r},{lon_f+r});\n  way{tag}({lat_f-r},{lon_f-r},{lat_f+r},{lon_f+r});")
-    
+    for (x, y), tag in missing:
+        south, west, north, east = tile_bbox(x, y)
+        box = f"({south},{west},{north},{east})"
+        statements.append(f"  node{tag}{box};\n  way{tag}{box};")
+
     query_body = "\n".join(statements)
-    
+    limit = OVERPASS_CELL_LIMIT * len(missing)
+
     query = f"""
 [out:json][timeout:30];
 (
@@ -719,17 +1134,148 @@ def _overpass_bounding_box(lat_f, lon_f, osm_tag, radius_km=8, limit=40):
 out center {limit};
 """
     try:
-        resp = requests.post(
-            'https://overpass-api.de/api/interpreter',
-            data={'data': query},
-            timeout=25,
-            headers={'User-Agent': 'TripPlannerApp/1.0'},
-        )
-        if resp.status_code == 200:
-            return resp.json().get('elements', [])
+        resp = upstream.hedged_post(overpass_pool, data={'data': query}, timeout=25)
+        if resp.status_code != 200:
+            return None, False
+        elements = resp.json().get('elements', [])
     except Exception as e:
         print(f"[Overpass] error: {e}")
-    return []
+        return None, False
+
+    cells = {cell: [] for cell in missing}
+    for el in elements:
+        lat, lon = _element_coords(el)
+        if lat is None:
+            continue
+        tile = tile_for(lat, lon)
+        tags = el.get('tags') or {}
+        for (cell_tile, tag), bucket in cells.items():
+            if cell_tile == tile and _matches_filter(tag, tags):
+                bucket.append(el)
+    return cells, len(elements) >= limit
+
+
+def _fill_overpass_tiles(missing):
+    """
+    Fetch and cache the cells still missing; shared by coalesced callers.
+    Returns (cells, complete).
+    """
+    cells, still_missing = {}, []
+    for tile, tag in missing:
+        cached = upstream_cache.get('overpass_tile', make_key(TILE_ZOOM, *tile, tag))
+        if cached is None:
+            still_missing.append((tile, tag))
+        else:
+            cells[(tile, tag)] = cached
+    if still_missing:
+        fetched, truncated = _fetch_overpass_tiles(still_missing)
+        if fetched is None:
+            return cells, False
+        if truncated:
+            print(f"[Overpass] output limit hit for {len(still_missing)} cells; not caching them")
+        else:
+            for (tile, tag), elements in fetched.items():
+                upstream_cache.set('overpass_tile', make_key(TILE_ZOOM, *tile, tag), elements)
+        cells.update(fetched)
+    return cells, True
+
+
+def _overpass_bbox(south, west, north, east, tag_filters, limit):
+    """
+    One Overpass query for the whole box, at most `limit` elements, cached
+    as a unit. Used for boxes too large for the tile cache.
+    Returns (elements, complete).
+    """
+    south, west, north, east = (round_coord(c) for c in (south, west, north, east))
+    box = f"({south},{west},{north},{east})"
+    query_body = "\n".join(f"  node{tag}{box};\n  way{tag}{box};" for tag in tag_filters)
+
+    query = f"""
+[out:json][timeout:30];
+(
+{query_body}
+);
+out center {limit};
+"""
+
+    def fetch():
+        try:
+            resp = upstream.hedged_post(overpass_pool, data={'data': query}, timeout=25)
+            if resp.status_code == 200:
+                return resp.json().get('elements', [])
+        except Exception as e:
+            print(f"[Overpass] error: {e}")
+        return None
+
+    key = make_key(south, west, north, east, *tag_filters, limit)
+    elements = upstream_cache.get_or_fetch('overpass_bbox', key, fetch)
+    return elements or [], elements is not None
+
+
+def _overpass_tiles(south, west, north, east, tag_filters, limit=OVERPASS_BBOX_LIMIT):
+    """
+    Return Overpass elements matching any of `tag_filters` inside the box.
+    The box is snapped to z/x/y tiles and each (tile, tag) result is cached
+    on its own, so only the cells not seen before are sent to Overpass.
+    Boxes covering more than OVERPASS_MAX_TILES tiles are sent as a single
+    bbox query returning at most `limit` elements instead.
+    Returns (elements, complete) — complete is False if a fetch failed and
+    only cached cells (expired ones included) could be used.
+    """
+    if count_tiles(south, west, north, east) > OVERPASS_MAX_TILES:
+        return _overpass_bbox(south, west, north, east, tag_filters, limit)
+
+    cells, missing = {}, []
+    for tile in tiles_covering(south, west, north, east):
+        for tag in tag_filters:
+            cached = upstream_cache.get('overpass_tile', make_key(TILE_ZOOM, *tile, tag))
+            if cached is None:
+                missing.append((tile, tag))
+            else:
+                cells[(tile, tag)] = cached
+
+    complete = True
+    if missing:
+        try:
+            fetched, complete = flight.do(f"overpass_tile|{make_key(TILE_ZOOM, *missing)}",
+                                          lambda: _fill_overpass_tiles(missing))
+        except deadline.DeadlineExceeded:
+            fetched, complete = {}, False    # budget ran out waiting on another request's fetch
+        cells.update(fetched)
+    if not complete:
+        # Overpass failed or its breaker is open: fall back to expired copies
+        for tile, tag in missing:
+            if (tile, tag) not in cells:
+                stale, _ = upstream_cache.lookup('overpass_tile', make_key(TILE_ZOOM, *tile, tag), count=False)
+                if stale is not None:
+                    cells[(tile, tag)] = stale
+        deadline.mark_partial()
+
+    merged = {}
+    for elements in cells.values():
+        for el in elements:
+            lat, lon = _element_coords(el)
+            if lat is not None and south <= lat <= north and west <= lon <= east:
+                merged[(el['type'], el['id'])] = el
+    return list(merged.values()), complete
+
+
+def _overpass_bounding_box(lat_f, lon_f, osm_tag, radius_km=8, limit=40):
+    """
+    Supplementary search using Overpass API bounding box.
+    Used when Nominatim returns < 5 named places.
+    Served from cached tiles where possible; results come back nearest-first.
+    """
+    r = radius_km / 111.0
+    elements, _ = _overpass_tiles(lat_f - r, lon_f - r, lat_f + r, lon_f + r, osm_tag.split('|'), limit)
+    cos_lat = math.cos(math.radians(lat_f))
+
+    def sq_dist(el):
+        lat, lon = _element_coords(el)
+        return (lat - lat_f) ** 2 + ((lon - lon_f) * cos_lat) ** 2
+
+    elements.sort(key=sq_dist)
+    return elements[:limit]
 
 
 def _parse_nominatim(results, label):
@@ -861,6 +1407,7 @@ def _parse_overpass(elements, label, ref_lat, ref_lon):
 
 
 @api.route('/weather', methods=['GET'])
+@deadline.budgeted('weather', 8)
 def get_weather():
     lat = request.args.get('lat')
     lon = request.args.get('lon')
@@ -869,18 +1416,27 @@ def get_weather():
         return jsonify({"error": "Missing lat or lon parameters"}), 400
         
     try:
+        lat, lon = round_coord(lat), round_coord(lon)
         url = "https://api.open-meteo.com/v1/forecast"
         params = {
             "latitude": lat,
             "longitude": lon,
             "current": "temperature_2m,weather_code",
         }
-        resp = requests.get(url, params=params, timeout=10)
-        
-        if resp.status_code == 200:
-            return jsonify(resp.json()), 200
+
+        def fetch():
+            try:
+                resp = upstream.get(url, params=params, timeout=10)
+            except Exception as e:
+                print(f"Weather API Error: {e}")
+                return None
+            return resp.json() if resp.status_code == 200 else None
+
+        weather = upstream_cache.get_or_fetch('weather', make_key(lat, lon), fetch)
+        if weather is not None:
+            return jsonify(weather), 200
         else:
-            return jsonify({"error": "Failed to fetch weather data"}), resp.status_code
+            return jsonify({"error": "Failed to fetch weather data"}), 502
     except Exception as e:
         print(f"Weather API Error: {e}")
         return jsonify({"error": str(e)}), 500
@@ -905,19 +1461,87 @@ def _resolve_slug(raw_slug):
 
 # ── new endpoints ──────────────────────────────────────────────────────────────
 
+def _local_nearby(slug, lat, lon, radius_km, k=None):
+    """
+    Places of this category from the local DB via the spatial index, nearest
+    first, each with distance_km. With k, the k nearest inside radius_km.
+    """
+    cat = Category.query.filter(func.lower(Category.slug) == slug.lower()).first()
+    if not cat:
+        return []
+    spatial_index.ensure_fresh(db.session)
+    if k:
+        hits = spatial_index.nearest(lat, lon, k, cat.id, max_radius_km=radius_km)
+    else:
+        hits = spatial_index.within(lat, lon, radius_km, cat.id, limit=LOCAL_NEARBY_LIMIT)
+    if not hits:
+        return []
+
+    rows = {r['id']: r for r in place_dicts(
+        place_projection().where(Place.id.in_([place_id for _, place_id in hits]),
+                                 Place.source.is_distinct_from('live'))
+    )}
+    places = []
+    for dist, place_id in hits:
+        row = rows.get(place_id)
+        if row:
+            row['distance_km'] = round(dist, 2)
+            places.append(row)
+    return places
+
+
+def _remember_live(places, slug, raw):
+    """
+    Queue places just built from live results for write-through into Place,
+    together with the raw OSM tags of the Nominatim items / Overpass elements
+    they came from. The write itself happens on the live_writer thread.
+    """
+    tags = {}
+    for item in raw:
+        if 'osm_type' in item:          # Nominatim result
+            item_tags = dict(item.get('extratags') or {})
+            item_tags.update(item.get('namedetails') or {})
+            if item.get('class'):
+                item_tags.setdefault(item['class'], item.get('type'))
+            tags[f"nom_{item['osm_type']}_{item.get('osm_id')}"] = item_tags
+        else:                           # Overpass element
+            tags[f"osm_{item['type']}_{item['id']}"] = item.get('tags') or {}
+    live_writer.submit((p, slug, tags.get(p['id'], {})) for p in places)
+
+
+def _in_imported_region(lat, lon):
+    """True if an offline OSM import (osm_import.py) covers this point."""
+    return any(r.contains(lat, lon) for r in ImportedRegion.query.all())
+
+
 @api.route('/nearby-places', methods=['GET'])
+@use_replica
+@deadline.budgeted('nearby_places', 15)
 def nearby_places():
     """
-    Return live places near GPS coordinates (uses Overpass bounding box).
-    Query params: lat, lon, slug, radius (km, default 5)
+    Return places near GPS coordinates, from the local DB when the point is
+    inside an imported region or the DB has enough of them, otherwise live
+    from Overpass.
+    Query params: lat, lon, slug, radius (km, default 5; 200 with k; at most
+                  SPATIAL_MAX_RADIUS_KM),
+                  k (k-nearest instead of everything in the radius),
+                  source ('auto' | 'local' | 'live', default auto)
+    The live lookup searches 5 km unless a radius is given, and never more
+    than NEARBY_LIVE_MAX_KM.
     """
-    lat    = request.args.get('lat')
-    lon    = request.args.get('lon')
+    lat_f  = request.args.get('lat', type=float)
+    lon_f  = request.args.get('lon', type=float)
     slug   = _resolve_slug(request.args.get('slug', '').strip())
-    radius = float(request.args.get('radius', 5))
+    k      = request.args.get('k', type=int)
+    asked  = request.args.get('radius', type=float)
+    radius = min(asked or (200 if k else 5), MAX_RADIUS_KM)
+    live_radius = min(asked or 5, NEARBY_LIVE_MAX_KM)
+    source = request.args.get('source', 'auto').lower()
 
-    if not lat or not lon or not slug:
+    if lat_f is None or lon_f is None or not slug:
         return jsonify({"error": "lat, lon and slug are required"}), 400
+    if not (-90 <= lat_f <= 90 and -180 <= lon_f <= 180):
+        return jsonify({"error": "lat or lon out of range"}), 400
 
     cfg = SLUG_CONFIG.get(slug)
     if not cfg:
@@ -925,28 +1549,155 @@ def nearby_places():
 
     _, osm_tag, label = cfg
     try:
-        elements = _overpass_bounding_box(float(lat), float(lon), osm_tag, radius)
-        places   = _parse_overpass(elements, label, float(lat), float(lon))
+        local = None
+        if source != 'live':
+            local = _local_nearby(slug, lat_f, lon_f, radius, k)
+            if source == 'local' or len(local) >= SPARSE_THRESHOLD or _in_imported_region(lat_f, lon_f):
+                return jsonify(_add_bus_realtime(local, slug)), 200
+
+        elements = _overpass_bounding_box(lat_f, lon_f, osm_tag, live_radius, limit=k or 40)
+        places   = _parse_overpass(elements, label, lat_f, lon_f)
+        _remember_live(places, slug, elements)
+        for p in places:
+            p['distance_km'] = round(haversine_km(lat_f, lon_f, p['latitude'], p['longitude']), 2)
+        if local and (slug in LOCAL_FIRST_SLUGS or not places):
+            # Curated rows stay in the answer; with Overpass down the sparse local answer beats none
+            extra, places = places, list(local)
+            _merge_places(places, extra)
+            places.sort(key=lambda p: p['distance_km'])
+            places = places[:k] if k else places
         return jsonify(_add_bus_realtime(places, slug)), 200
     except Exception as e:
         print(f"[/nearby-places] {e}")
         return jsonify({"error": str(e)}), 500
 
 
+def _overpass_city_supplement(city, slug, osm_tag, label, radius, geo=None):
+    """
+    Geocode the city (unless its centre `geo` is given), then pull places
+    around it from Overpass. Returns (places, elements); the caller writes
+    through only the places it merges into its answer (_merge_supplement).
+    """
+    geo = geo or _geocode_city(city)
+    if not geo:
+        return [], []
+    lat_f, lon_f = geo
+    elements = _overpass_bounding_box(lat_f, lon_f, osm_tag, radius_km=radius, limit=40)
+    return _parse_overpass(elements, label, lat_f, lon_f), elements
+
+
+def _local_city_places(city, slug, radius, geo=None):
+    """Stored places of this category around the city, or with the city in their address."""
+    geo = geo or _geocode_city(city)
+    if geo:
+        return _local_nearby(slug, geo[0], geo[1], radius)
+    return place_dicts(
+        place_projection()
+        .where(func.lower(Category.slug) == slug.lower(),
+               func.lower(Place.location).contains(city.lower(), autoescape=True))
+        .order_by(Place.id)
+        .limit(LOCAL_NEARBY_LIMIT)
+    )
+
+
+def _merge_places(places, extra):
+    """Append places from `extra` whose names aren't already present. Returns count added."""
+    existing = {p['name'] for p in places}
+    added = 0
+    for p in extra:
+        if p['name'] not in existing:
+            places.append(p)
+            existing.add(p['name'])
+            added += 1
+    return added
+
+
+def _merge_supplement(places, supplement, slug):
+    """Merge an _overpass_city_supplement result and write through the places added."""
+    extra, elements = supplement
+    before = len(places)
+    added = _merge_places(places, extra)
+    _remember_live(places[before:], slug, elements)
+    return added
+
+
+def _places_by_city_serial(city, slug, keyword, osm_tag, label, radius, geo=None):
+    # ── Step 1: Nominatim keyword search ────────────────────────────────────
+    raw     = _nominatim_keyword_search(keyword, city, limit=40)
+    places  = _parse_nominatim(raw, label)
+    _remember_live(places, slug, raw)
+    print(f"[/places-by-city] Nominatim '{keyword} in {city}': {len(raw)} raw → {len(places)} named")
+
+    # ── Step 2: Overpass supplement if Nominatim gave too few ────────────────
+    if len(places) < SPARSE_THRESHOLD:
+        try:
+            added = _merge_supplement(places, _overpass_city_supplement(city, slug, osm_tag, label, radius, geo), slug)
+            print(f"[/places-by-city] Overpass added {added} → total {len(places)}")
+        except Exception as e:
+            print(f"[/places-by-city] Overpass supplement failed: {e}")
+    return places
+
+
+def _places_by_city_parallel(city, slug, keyword, osm_tag, label, radius, geo=None):
+    """
+    Run the keyword search and the geocode+Overpass supplement side by side
+    within the request's budget. The supplement is only merged in when the
+    keyword search comes back sparse; otherwise it just warms the cache.
+    """
+    until = time.monotonic() + deadline.remaining(CITY_SEARCH_DEADLINE)
+    keyword_future    = deadline.submit(_fanout_pool, _nominatim_keyword_search, keyword, city, 40)
+    supplement_future = deadline.submit(_fanout_pool, _overpass_city_supplement,
+                                        city, slug, osm_tag, label, radius, geo)
+
+    places = []
+    try:
+        raw    = keyword_future.result(timeout=max(0, until - time.monotonic()))
+        places = _parse_nominatim(raw, label)
+        _remember_live(places, slug, raw)
+        print(f"[/places-by-city] Nominatim '{keyword} in {city}': {len(raw)} raw → {len(places)} named")
+    except FuturesTimeout:
+        deadline.mark_partial()
+        print(f"[/places-by-city] Nominatim '{keyword} in {city}' missed the deadline")
+
+    if len(places) < SPARSE_THRESHOLD:
+        try:
+            supplement = supplement_future.result(timeout=max(0, until - time.monotonic()))
+            added = _merge_supplement(places, supplement, slug)
+            print(f"[/places-by-city] Overpass added {added} → total {len(places)}")
+        except FuturesTimeout:
+            deadline.mark_partial()
+            print("[/places-by-city] Overpass supplement missed the deadline")
+        except Exception as e:
+            print(f"[/places-by-city] Overpass supplement failed: {e}")
+    return places
+
+
 @api.route('/places-by-city', methods=['GET'])
+@use_replica
+@deadline.budgeted('places_by_city', CITY_SEARCH_DEADLINE)
 def places_by_city():
     """
     Search real named places in a city.
     Primary:   Nominatim keyword search  ("restaurant in Coimbatore")
     Fallback:  Overpass bounding box     (if Nominatim returns < 5 results)
-    Query params: city, slug, radius (km, default 8)
+    Cities inside an imported region are answered from the local DB.
+    Query params: city, slug, radius (km, default 8),
+                  lat, lon (the city's centre if already resolved, e.g. by
+                  /api/geocode — skips geocoding it again),
+                  mode ('parallel' or 'serial', default from PLACES_BY_CITY_MODE),
+                  source ('auto' | 'live', default auto)
     """
     city   = request.args.get('city', '').strip()
     slug   = _resolve_slug(request.args.get('slug', '').strip())
     radius = float(request.args.get('radius', 8))
+    mode   = request.args.get('mode', PLACES_BY_CITY_MODE).lower()
+    source = request.args.get('source', 'auto').lower()
+    lat    = request.args.get('lat', type=float)
+    lon    = request.args.get('lon', type=float)
 
     if not city or not slug:
         return jsonify({"error": "city and slug are required"}), 400
+    geo = (lat, lon) if lat is not None and lon is not None else None
 
     cfg = SLUG_CONFIG.get(slug)
     if not cfg:
@@ -954,36 +1705,23 @@ def places_by_city():
 
     keyword, osm_tag, label = cfg
 
-    # ── Step 1: Nominatim keyword search ────────────────────────────────────
-    raw     = _nominatim_keyword_search(keyword, city, limit=40)
-    places  = _parse_nominatim(raw, label)
-    print(f"[/places-by-city] Nominatim '{keyword} in {city}': {len(raw)} raw → {len(places)} named")
+    if source != 'live' and ImportedRegion.query.first():
+        geo = geo or _geocode_city(city)
+        if geo and _in_imported_region(*geo):
+            places = _local_nearby(slug, geo[0], geo[1], radius)
+            print(f"[/places-by-city] served {len(places)} '{slug}' in {city} from imported data")
+            return jsonify(_add_bus_realtime(places, slug)), 200
 
-    # ── Step 2: Overpass supplement if Nominatim gave too few ────────────────
-    if len(places) < 5:
-        time.sleep(0.5)
-        try:
-            geo = requests.get(
-                'https://nominatim.openstreetmap.org/search',
-                params={'q': city, 'format': 'json', 'limit': 1},
-                headers={'User-Agent': 'TripPlannerApp/1.0'},
-                timeout=10,
-            ).json()
-            if geo:
-                lat_f = float(geo[0]['lat'])
-                lon_f = float(geo[0]['lon'])
-                elements    = _overpass_bounding_box(lat_f, lon_f, osm_tag, radius_km=radius, limit=40)
-                ovr_places  = _parse_overpass(elements, label, lat_f, lon_f)
-                existing    = {p['name'] for p in places}
-                added = 0
-                for p in ovr_places:
-                    if p['name'] not in existing:
-                        places.append(p)
-                        existing.add(p['name'])
-                        added += 1
-                print(f"[/places-by-city] Overpass added {added} → total {len(places)}")
-        except Exception as e:
-            print(f"[/places-by-city] Overpass supplement failed: {e}")
+    if mode == 'serial':
+        places = _places_by_city_serial(city, slug, keyword, osm_tag, label, radius, geo)
+    else:
+        places = _places_by_city_parallel(city, slug, keyword, osm_tag, label, radius, geo)
+
+    if not places:
+        # Upstreams failed, breakers open or nothing found: fall back to what the DB has
+        places = _local_city_places(city, slug, radius, geo)
+        if places:
+            deadline.mark_partial()
 
     if not places:
         # Return empty list with 200 instead of 404 to avoid frontend errors
@@ -991,3 +1729,115 @@ def places_by_city():
 
     return jsonify(_add_bus_realtime(places, slug)), 200
 
+
+# ── geocoding ─────────────────────────────────────────────────────────────────
+
+def _gazetteer_result(entry):
+    return {
+        'name':         entry['name'],
+        'display_name': entry['display_name'],
+        'lat':          entry['lat'],
+        'lon':          entry['lon'],
+        'type':         'city',
+        'source':       'gazetteer',
+    }
+
+
+def _nominatim_result(item):
+    return {
+        'name':         item.get('name') or item.get('display_name', '').split(',')[0],
+        'display_name': item.get('display_name', ''),
+        'lat':          float(item['lat']),
+        'lon':          float(item['lon']),
+        'type':         item.get('type'),
+        'source':       'nominatim',
+    }
+
+
+@api.route('/geocode', methods=['GET'])
+@deadline.budgeted('geocode', 8)
+def geocode():
+    """
+    Resolve a place name for the frontend, so browsers don't call Nominatim
+    themselves. A known city comes from the local gazetteer; everything else
+    from Nominatim through the shared cache, so each name is looked up once
+    for all users.
+    Query params: q, limit (1-10, default 5)
+    Returns [{name, display_name, lat, lon, type, source}], best match first.
+    """
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 5, type=int), 1), 10)
+    if len(query) < 2:
+        return jsonify([]), 200
+
+    results = []
+    known = gazetteer.lookup(query)
+    if known:
+        results.append(_gazetteer_result(known))
+    if len(results) < limit:
+        for item in _nominatim_geocode(query, limit):
+            result = _nominatim_result(item)
+            if known and result['name'].lower() == known['name'].lower() and \
+                    haversine_km(known['lat'], known['lon'], result['lat'], result['lon']) < 10:
+                continue                      # the same city, already listed
+            results.append(result)
+    return jsonify(results[:limit]), 200
+
+
+@api.route('/reverse-geocode', methods=['GET'])
+@deadline.budgeted('reverse_geocode', 8)
+def reverse_geocode():
+    """
+    Name the place at a coordinate: the nearest known city within
+    GAZETTEER_REVERSE_KM, else Nominatim /reverse (city level) through the
+    shared cache.
+    Query params: lat, lon
+    Returns {name, display_name, lat, lon, type, source}.
+    """
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    if lat is None or lon is None:
+        return jsonify({"error": "lat and lon are required"}), 400
+    lat, lon = round_coord(lat), round_coord(lon)
+
+    near = gazetteer.nearest(lat, lon)
+    if near:
+        return jsonify(_gazetteer_result(near[1])), 200
+
+    def fetch():
+        try:
+            resp = upstream.hedged_get(
+                nominatim_pool, '/reverse',
+                params={'lat': lat, 'lon': lon, 'format': 'json', 'zoom': 10},
+                timeout=10,
+            )
+            if resp.status_code == 200:
+                data = resp.json()
+                return {} if 'error' in data else data   # e.g. open sea
+        except Exception as e:
+            print(f"[Nominatim reverse] error: {e}")
+        return None
+
+    item = upstream_cache.get_or_fetch('nominatim_reverse', make_key(lat, lon), fetch)
+    if item is None:
+        return jsonify({"error": "Reverse geocoding failed"}), 502
+    if not item:
+        return jsonify({"error": "No named place here"}), 404
+    return jsonify(_nominatim_result(item)), 200
+
+
+# ── upstream stats ────────────────────────────────────────────────────────────
+
+@api.route('/upstream/stats', methods=['GET'])
+def upstream_stats():
+    """Cache hit/miss counters, request coalescing, HTTP pools, rate governors, write-through and breakers."""
+    return jsonify({
+        'cache': upstream_cache.stats(),
+        'singleflight': flight.stats(),
+        'pools': upstream.pool_stats(),
+        'rate_limits': ratelimit.stats(),
+        'spatial_index': spatial_index.stats(),
+        'live_writer': live_writer.stats(),
+        'breakers': breaker.stats(),
+        'gazetteer': gazetteer.stats(),
+    }), 200
@@ -0,0 +1,63 @@
+"""
+In-place schema upgrades for existing databases.
+
+db.create_all() only creates missing tables; it never touches tables that
+already exist. upgrade_schema() adds whatever columns and indexes newer
+versions of models.py declare, so an old trip_planner.db keeps working
+without a reset. Columns that need values before their index can be built
+(place.name_key) are backfilled in between.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from database import db
+from models import Category, Place, User, normalize_name
+
+
+def _add_missing_columns(conn, table):
+    existing = {c['name'] for c in inspect(conn).get_columns(table.name)}
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        col_type = column.type.compile(dialect=conn.dialect)
+        conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}')
+        print(f"[schema] added {table.name}.{column.name}")
+
+
+def _backfill_name_keys(conn):
+    """
+    Fill place.name_key where it is missing. If a category already holds two
+    non-OSM places with the same normalized name, only the oldest gets the
+    key; the others keep NULL so the unique index can still be built.
+    """
+    rows = conn.execute(text(
+        "SELECT id, category_id, name, osm_id FROM place WHERE name_key IS NULL ORDER BY id"
+    )).all()
+    if not rows:
+        return
+    taken = set(conn.execute(text(
+        "SELECT category_id, name_key FROM place WHERE name_key IS NOT NULL AND osm_id IS NULL"
+    )).all())
+    updates = []
+    for place_id, category_id, name, osm_id in rows:
+        key = normalize_name(name)
+        if osm_id is None:
+            if (category_id, key) in taken:
+                continue
+            taken.add((category_id, key))
+        updates.append({'id': place_id, 'key': key})
+    if updates:
+        conn.execute(text("UPDATE place SET name_key = :key WHERE id = :id"), updates)
+        print(f"[schema] backfilled place.name_key on {len(updates)} rows")
+
+
+def upgrade_schema():
+    """Add declared columns and indexes missing from existing tables. Safe to run repeatedly."""
+    with db.engine.begin() as conn:
+        _add_missing_columns(conn, Place.__table__)
+        _backfill_name_keys(conn)
+        for table in (Place.__table__, Category.__table__, User.__table__):
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+        if conn.dialect.name == 'sqlite':
+            conn.exec_driver_sql('PRAGMA optimize')   # refresh planner stats for new indexes
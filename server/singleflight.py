@@ -0,0 +1,140 @@
+"""
+Single-flight coalescing for upstream fetches.
+
+When several threads ask for the same key at once, only the first one runs
+the fetch; the rest wait and share its result (or its exception). A waiter
+waits no longer than its own request budget (deadline.py): when that runs
+out it raises DeadlineExceeded, and the leader carries on. Setting
+SINGLEFLIGHT_LOCK_DIR additionally serialises identical fetches across worker
+processes with a file lock — the waiting process then usually finds the
+answer already in the shared SQLite cache. Keys are hashed onto a fixed set
+of SINGLEFLIGHT_LOCK_STRIPES lock files, so the directory doesn't grow with
+every distinct query; unrelated keys on the same stripe just take turns.
+Threads of one process queue on an in-memory lock per stripe before touching
+the file, and both waits end with DeadlineExceeded when the budget runs out,
+so the caller can fall back to a stale answer.
+"""
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import deadline
+
+try:
+    import fcntl
+except ImportError:   # Windows dev machines: thread-level coalescing only
+    fcntl = None
+
+LOCK_DIR     = os.environ.get('SINGLEFLIGHT_LOCK_DIR', '')
+LOCK_STRIPES = int(os.environ.get('SINGLEFLIGHT_LOCK_STRIPES', 256))
+_POLL_SECONDS = 0.05   # between non-blocking flock attempts
+
+
+def _out_of_budget(key):
+    deadline.mark_partial()
+    raise deadline.DeadlineExceeded(f"request budget ran out waiting for {key}")
+
+
+def _flock(fh, key):
+    """Take the file lock, polling so the wait ends with the request budget."""
+    if deadline.remaining(None) is None:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        return
+    while True:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            left = deadline.remaining(0.0)
+            if left <= 0:
+                _out_of_budget(key)
+            time.sleep(min(_POLL_SECONDS, left))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, lock_dir=LOCK_DIR, stripes=LOCK_STRIPES):
+        self.lock_dir = lock_dir if fcntl else ''
+        self.stripes = max(1, stripes)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stripe_locks = [threading.Lock() for _ in range(self.stripes)]
+        self._held = threading.local()   # stripes this thread holds, so nested calls don't self-deadlock
+        self.leaders = 0
+        self.coalesced = 0
+
+    @contextmanager
+    def _process_lock(self, key):
+        if not self.lock_dir:
+            yield
+            return
+        os.makedirs(self.lock_dir, exist_ok=True)
+        stripe = int.from_bytes(hashlib.sha1(key.encode()).digest()[:4], 'big') % self.stripes
+        held = self._held.__dict__.setdefault('stripes', set())
+        if stripe in held:
+            yield
+            return
+        wait = deadline.remaining(None)
+        if not self._stripe_locks[stripe].acquire(timeout=-1 if wait is None else wait):
+            _out_of_budget(key)
+        try:
+            with open(os.path.join(self.lock_dir, f"{stripe:03d}.lock"), 'w') as fh:
+                _flock(fh, key)
+                held.add(stripe)
+                try:
+                    yield
+                finally:
+                    held.discard(stripe)
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+        finally:
+            self._stripe_locks[stripe].release()
+
+    def do(self, key, fn):
+        """Run fn() once for all concurrent callers with the same key."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not call.done.wait(deadline.remaining(None)):
+                _out_of_budget(key)
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            with self._process_lock(key):
+                call.value = fn()
+            return call.value
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'leaders':       self.leaders,
+                'coalesced':     self.coalesced,
+                'in_flight':     len(self._calls),
+                'cross_process': bool(self.lock_dir),
+            }
+
+
+flight = SingleFlight()
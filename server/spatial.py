@@ -0,0 +1,255 @@
+"""
+In-memory grid index over Place coordinates.
+
+Lets /api/nearby-places answer radius and k-nearest queries from the local
+Place table in well under a millisecond instead of going to Overpass. The
+index is kept current by ORM flush/commit events. Rows written through from
+live searches (source='live') are left out: they only hold what one Overpass
+answer happened to contain. Every SPATIAL_REFRESH_SECONDS it is rebuilt to
+pick up writes made by other worker processes. Rebuilds, including the one at
+startup, run on a background thread that streams the table and swaps the new
+index in, so a request never waits on a full scan. Writes that land while a
+rebuild is running are replayed onto the new index.
+"""
+import math
+import os
+import threading
+import time
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+CELL_DEG        = float(os.environ.get('SPATIAL_CELL_DEG', 0.05))    # ≈ 5.5 km
+REFRESH_SECONDS = float(os.environ.get('SPATIAL_REFRESH_SECONDS', 300))
+MAX_RADIUS_KM   = float(os.environ.get('SPATIAL_MAX_RADIUS_KM', 200))  # widest query served
+_REBUILD_BATCH  = 50000   # rows fetched per round trip while rebuilding
+
+EARTH_RADIUS_KM = 6371.0
+_COLS = int(round(360.0 / CELL_DEG))   # longitude cells around the globe
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _cell(lat, lon):
+    return int(math.floor(lat / CELL_DEG)), int(math.floor(lon / CELL_DEG))
+
+
+def _spans(lat, radius_km):
+    """
+    Rows and columns of cells either side of lat that a radius_km query must
+    cover. Columns are sized for the highest latitude the radius reaches and
+    never exceed half the globe, so queries near the poles stay bounded.
+    """
+    lat_span = radius_km / 111.0
+    edge = min(abs(lat) + lat_span, 90.0)
+    lon_span = min(radius_km / (111.0 * max(math.cos(math.radians(edge)), 1e-9)), 180.0)
+    return int(math.ceil(lat_span / CELL_DEG)), min(int(math.ceil(lon_span / CELL_DEG)), _COLS // 2)
+
+
+def _put(points, cells, place_id, point):
+    """Set or (point=None) clear one place in a points/cells pair."""
+    old = points.pop(place_id, None)
+    if old:
+        cell = cells.get(_cell(old[0], old[1]))
+        if cell:
+            cell.discard(place_id)
+    if point is not None and point[0] is not None and point[1] is not None:
+        points[place_id] = point
+        cells.setdefault(_cell(point[0], point[1]), set()).add(place_id)
+
+
+class GridIndex:
+    def __init__(self):
+        self._points = {}    # place_id -> (lat, lon, category_id)
+        self._cells = {}     # (row, col) -> set(place_id)
+        self._lock = threading.RLock()
+        self._journal = None  # writes made while a rebuild is reading the table
+        self._rebuilding = False
+        self.built_at = 0.0
+
+    # ── maintenance ──────────────────────────────────────────────────────────
+
+    def add(self, place_id, lat, lon, category_id):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((place_id, (lat, lon, category_id)))
+            _put(self._points, self._cells, place_id, (lat, lon, category_id))
+
+    def remove(self, place_id):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((place_id, None))
+            _put(self._points, self._cells, place_id, None)
+
+    def rebuild(self, session):
+        """Reload every located place from the DB, then swap the new index in."""
+        from models import Place
+        with self._lock:
+            self._journal = []
+        try:
+            rows = session.execute(
+                select(Place.id, Place.latitude, Place.longitude, Place.category_id)
+                .where(Place.latitude.isnot(None), Place.longitude.isnot(None),
+                       Place.source.is_distinct_from('live'))
+                .execution_options(yield_per=_REBUILD_BATCH)
+            )
+            points, cells = {}, {}
+            for place_id, lat, lon, category_id in rows:
+                points[place_id] = (lat, lon, category_id)
+                cells.setdefault(_cell(lat, lon), set()).add(place_id)
+            with self._lock:
+                for place_id, point in self._journal:
+                    _put(points, cells, place_id, point)
+                self._points, self._cells = points, cells
+                self.built_at = time.time()
+        finally:
+            with self._lock:
+                self._journal = None
+
+    def rebuild_in_background(self, engine):
+        """Start rebuild() on its own thread and session, unless one is already running."""
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+
+        def run():
+            started = time.time()
+            try:
+                with Session(engine) as session:
+                    self.rebuild(session)
+                print(f"[spatial] indexed {len(self._points)} places in {time.time() - started:.1f}s")
+            except Exception as e:
+                print(f"[spatial] rebuild failed: {e}")
+            finally:
+                with self._lock:
+                    self._rebuilding = False
+
+        threading.Thread(target=run, name='spatial-rebuild', daemon=True).start()
+
+    def ensure_fresh(self, session):
+        """Schedule a background rebuild once the index is older than REFRESH_SECONDS. Never blocks."""
+        if time.time() - self.built_at > REFRESH_SECONDS:
+            self.rebuild_in_background(session.get_bind())
+
+    # ── queries ──────────────────────────────────────────────────────────────
+
+    def _ring(self, row, col, r, rows, cols):
+        """Cells at Chebyshev distance exactly r from (row, col), at most rows/cols away."""
+        if r == 0:
+            yield row, col
+            return
+        if r <= rows:
+            for dc in range(-min(r, cols), min(r, cols) + 1):
+                yield row - r, col + dc
+                yield row + r, col + dc
+        if r <= cols:
+            for dr in range(-min(r - 1, rows), min(r - 1, rows) + 1):
+                yield row + dr, col - r
+                yield row + dr, col + r
+
+    def _scan(self, lat, lon, category_id, rows, cols):
+        row, col = _cell(lat, lon)
+        if (2 * rows + 1) * (2 * cols + 1) > len(self._cells):
+            # Wider than the occupied cells (radius reaching a pole): walk those instead
+            found = []
+            for (cell_row, cell_col), ids in self._cells.items():
+                dc = (cell_col - col) % _COLS
+                if abs(cell_row - row) <= rows and min(dc, _COLS - dc) <= cols:
+                    found.extend(self._hits(lat, lon, category_id, ids))
+            yield max(rows, cols), found
+            return
+        half = _COLS // 2
+        seen = set() if 2 * cols >= _COLS else None   # both edges land on the same column
+        for r in range(max(rows, cols) + 1):
+            found = []
+            for cell_row, cell_col in self._ring(row, col, r, rows, cols):
+                cell = (cell_row, (cell_col + half) % _COLS - half)   # wrap at the antimeridian
+                if seen is not None:
+                    if cell in seen:
+                        continue
+                    seen.add(cell)
+                found.extend(self._hits(lat, lon, category_id, self._cells.get(cell, ())))
+            yield r, found
+
+    def _hits(self, lat, lon, category_id, place_ids):
+        for place_id in place_ids:
+            plat, plon, cat = self._points[place_id]
+            if category_id is None or cat == category_id:
+                yield haversine_km(lat, lon, plat, plon), place_id
+
+    def within(self, lat, lon, radius_km, category_id=None, limit=None):
+        """[(distance_km, place_id)] inside the radius (at most MAX_RADIUS_KM), nearest first."""
+        radius_km = min(radius_km, MAX_RADIUS_KM)
+        rows, cols = _spans(lat, radius_km)
+        with self._lock:
+            hits = [h for _, found in self._scan(lat, lon, category_id, rows, cols)
+                    for h in found if h[0] <= radius_km]
+        hits.sort()
+        return hits[:limit] if limit else hits
+
+    def nearest(self, lat, lon, k, category_id=None, max_radius_km=200):
+        """The k closest places as [(distance_km, place_id)], nearest first."""
+        max_radius_km = min(max_radius_km, MAX_RADIUS_KM)
+        rows, cols = _spans(lat, max_radius_km)
+        cos_lat = math.cos(math.radians(min(abs(lat) + max_radius_km / 111.0, 90.0)))
+        hits, kth = [], None
+        with self._lock:
+            for r, found in self._scan(lat, lon, category_id, rows, cols):
+                if found:
+                    hits.extend(found)
+                    if len(hits) >= k:
+                        kth = sorted(hits)[k - 1][0]
+                # Anything beyond ring r is at least r cells away (longitude cells are the
+                # narrower until the columns run out)
+                if kth is not None and kth <= r * CELL_DEG * 111.0 * (1.0 if r >= cols else cos_lat):
+                    break
+        hits.sort()
+        return [h for h in hits if h[0] <= max_radius_km][:k]
+
+    def stats(self):
+        with self._lock:
+            return {'points': len(self._points), 'cells': len(self._cells),
+                    'age_s': round(time.time() - self.built_at, 1) if self.built_at else None,
+                    'rebuilding': self._rebuilding}
+
+
+spatial_index = GridIndex()
+
+
+# ── keep the index in step with ORM writes ────────────────────────────────────
+
+def _pending(session):
+    return session.info.setdefault('spatial_pending', {})
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_place_writes(session, flush_context):
+    from models import Place
+    pending = _pending(session)
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Place):
+            live = obj.source == 'live'
+            pending[obj.id] = None if live else (obj.latitude, obj.longitude, obj.category_id)
+    for obj in session.deleted:
+        if isinstance(obj, Place):
+            pending[obj.id] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_place_writes(session):
+    for place_id, point in session.info.pop('spatial_pending', {}).items():
+        if point is None:
+            spatial_index.remove(place_id)
+        else:
+            spatial_index.add(place_id, *point)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_place_writes(session):
+    session.info.pop('spatial_pending', None)
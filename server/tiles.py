@@ -0,0 +1,44 @@
+"""
+Slippy-map (z/x/y) tile helpers used to snap Overpass bounding boxes onto a
+fixed grid, so nearby map centres share cached results.
+"""
+import math
+import os
+
+# z13 tiles are ~4.9 km wide at the equator
+TILE_ZOOM = int(os.environ.get('OVERPASS_TILE_ZOOM', 13))
+
+_MAX_LAT = 85.05112878
+
+
+def tile_for(lat, lon, z=TILE_ZOOM):
+    """Return the (x, y) tile containing a point."""
+    lat = max(-_MAX_LAT, min(_MAX_LAT, lat))
+    n = 2 ** z
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bbox(x, y, z=TILE_ZOOM):
+    """Return (south, west, north, east) for a tile."""
+    n = 2 ** z
+
+    def lat_of(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat_of(y + 1), x / n * 360.0 - 180.0, lat_of(y), (x + 1) / n * 360.0 - 180.0
+
+
+def tiles_covering(south, west, north, east, z=TILE_ZOOM):
+    """List every (x, y) tile that intersects the bounding box."""
+    x0, y0 = tile_for(north, west, z)
+    x1, y1 = tile_for(south, east, z)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def count_tiles(south, west, north, east, z=TILE_ZOOM):
+    """Number of tiles tiles_covering() would return, without listing them."""
+    x0, y0 = tile_for(north, west, z)
+    x1, y1 = tile_for(south, east, z)
+    return max(0, x1 - x0 + 1) * max(0, y1 - y0 + 1)
@@ -0,0 +1,263 @@
+"""
+Shared HTTP client for upstream APIs (Nominatim, Overpass, OSRM, Open-Meteo).
+
+Every host gets one long-lived requests.Session with its own keep-alive
+connection pool, so live lookups reuse TCP/TLS connections instead of
+handshaking on every call. Transient failures are retried with backoff, and
+every call first waits for a token from the host's rate governor. For
+rate-limited hosts the retries happen here rather than inside urllib3, so
+each attempt takes a token of its own.
+
+If aiohttp is available, get()/post() go through the asyncio gateway
+(gateway.py) instead, which multiplexes every outbound call on one event
+loop thread; the requests sessions remain the fallback.
+
+Inside a budgeted request (deadline.py) both the wait for a rate-limit
+token and the call's timeout are capped at what is left of the budget.
+Each host also has a circuit breaker (breaker.py): while it is open, calls
+raise CircuitOpen at once instead of being sent.
+
+Overpass and Nominatim are called through hedged_get()/hedged_post() with a
+pool of equivalent endpoints (endpoints.py) rather than a fixed URL.
+"""
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import breaker
+import deadline
+import endpoints
+import gateway
+import ratelimit
+from ratelimit import INTERACTIVE
+
+USER_AGENT      = 'TripPlannerApp/1.0 (trip-planner-app)'
+POOL_SIZE       = int(os.environ.get('UPSTREAM_POOL_SIZE', 10))
+DEFAULT_TIMEOUT = float(os.environ.get('UPSTREAM_TIMEOUT', 10))
+RETRIES         = int(os.environ.get('UPSTREAM_RETRIES', 2))
+BACKOFF         = float(os.environ.get('UPSTREAM_BACKOFF', 0.3))
+HEDGE_WORKERS   = int(os.environ.get('UPSTREAM_HEDGE_WORKERS', 16))   # requests-session path only
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+_RETRY_STATUS = (502, 503, 504)
+
+
+def _build_session(retries=RETRIES):
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,                         # a read timeout already spent the caller's budget
+        backoff_factor=BACKOFF,
+        status_forcelist=_RETRY_STATUS,
+        allowed_methods=frozenset(['GET', 'POST']),   # Overpass queries are POSTed but idempotent
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.headers['User-Agent'] = USER_AGENT
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def session_for(url):
+    """Return the pooled session for the URL's host, creating it on first use."""
+    host = urlsplit(url).netloc
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            # Governed hosts are retried in _session_request, one token per attempt
+            retries = 0 if host in ratelimit.HOST_LIMITS else RETRIES
+            session = _sessions[host] = _build_session(retries)
+        return session
+
+
+def _throttle(url, priority):
+    gov = ratelimit.governor_for(urlsplit(url).netloc)
+    if gov is not None:
+        gov.acquire(priority, deadline.remaining(ratelimit.MAX_WAIT))
+
+
+_gateway = gateway.AsyncGateway(USER_AGENT, RETRIES, BACKOFF) if gateway.wanted() else None
+_hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='hedge')
+
+
+def _session_request(method, url, timeout, priority, kwargs):
+    session = session_for(url)
+    if ratelimit.governor_for(urlsplit(url).netloc) is None:
+        return session.request(method, url, timeout=deadline.timeout(timeout), **kwargs)
+
+    for attempt in range(RETRIES + 1):
+        _throttle(url, priority)
+        try:
+            resp, error = session.request(method, url, timeout=deadline.timeout(timeout), **kwargs), None
+        except requests.ConnectionError as e:
+            resp, error = None, e
+        if error is None and resp.status_code not in _RETRY_STATUS:
+            return resp
+        delay = BACKOFF * (2 ** attempt)
+        # Retry only while the request's budget has room for the backoff and another call
+        if attempt == RETRIES or deadline.remaining(delay + 1) < delay + deadline.MIN_CALL_SECONDS:
+            if error is not None:
+                raise error
+            return resp
+        time.sleep(delay)
+
+
+def _failed(e):
+    if isinstance(e, (requests.Timeout, ratelimit.RateLimitTimeout)):
+        deadline.mark_partial()
+
+
+def _request(method, url, timeout, priority, **kwargs):
+    timeout = timeout or DEFAULT_TIMEOUT
+    deadline.timeout(timeout)             # fail fast once the request's budget is spent
+    circuit = breaker.breaker_for(url)
+    probe = circuit.before()              # raises CircuitOpen while the host is failing
+    start = time.monotonic()
+    try:
+        if _gateway is not None:
+            resp = _gateway.request(method, url, timeout, priority,
+                                    max_wait=deadline.remaining(ratelimit.MAX_WAIT),
+                                    expires=deadline.expires_at(), **kwargs)
+        else:
+            resp = _session_request(method, url, timeout, priority, kwargs)
+    except Exception as e:
+        circuit.after(probe, time.monotonic() - start, error=e)
+        _failed(e)
+        raise
+    circuit.after(probe, time.monotonic() - start, status_code=resp.status_code)
+    return resp
+
+
+def get(url, timeout=None, priority=INTERACTIVE, **kwargs):
+    return _request('GET', url, timeout, priority, **kwargs)
+
+
+def post(url, timeout=None, priority=INTERACTIVE, **kwargs):
+    return _request('POST', url, timeout, priority, **kwargs)
+
+
+# ── hedged requests over endpoint pools ──────────────────────────────────────
+
+def _launch(pool, ep, method, path, timeout, priority, kwargs):
+    """Start one attempt against `ep`; returns a Future. Its outcome feeds the breaker and pool health."""
+    url = ep.url + path
+    circuit = breaker.breaker_for(url)
+    probe = circuit.before()
+    start = time.monotonic()
+    if _gateway is not None:
+        future = _gateway.submit(method, url, timeout, priority,
+                                 max_wait=deadline.remaining(ratelimit.MAX_WAIT),
+                                 expires=deadline.expires_at(), **kwargs)
+    else:
+        future = deadline.submit(_hedge_pool, _session_request, method, url, timeout, priority, kwargs)
+
+    def settle(f):
+        elapsed = time.monotonic() - start
+        if f.cancelled():
+            circuit.after(probe, elapsed, error=CancelledError())
+            pool.record_loss(ep, elapsed)
+        elif f.exception() is not None:
+            circuit.after(probe, elapsed, error=f.exception())
+            pool.record(ep, elapsed, ok=False)
+        else:
+            status = f.result().status_code
+            circuit.after(probe, elapsed, status_code=status)
+            pool.record(ep, elapsed, ok=not breaker.is_bad_status(status))
+
+    future.add_done_callback(settle)
+    return future
+
+
+def _single(pool, method, path, timeout, priority, kwargs):
+    """One attempt, on the calling thread: no hedge-pool hop when there is nothing to hedge with."""
+    ep = pool.pick()[0]
+    start = time.monotonic()
+    try:
+        resp = _request(method, ep.url + path, timeout, priority, **kwargs)
+    except (breaker.CircuitOpen, deadline.DeadlineExceeded):
+        raise                                 # not attempted: says nothing about the endpoint
+    except Exception:
+        pool.record(ep, time.monotonic() - start, ok=False)
+        raise
+    pool.record(ep, time.monotonic() - start, ok=not breaker.is_bad_status(resp.status_code))
+    return resp
+
+
+def _hedged(pool, method, path, timeout, priority, **kwargs):
+    """
+    Send the request to one endpoint of `pool`; if it hasn't answered within
+    the pool's hedge delay (or failed), send it to the next one too. The first
+    good response wins and the other attempt is cancelled — on the gateway
+    that aborts it; a requests call already running is left to finish unseen.
+    Background calls, and pools that can't hedge, make a single plain call.
+    """
+    if priority != INTERACTIVE or not pool.can_hedge():
+        return _single(pool, method, path, timeout, priority, kwargs)
+
+    timeout = timeout or DEFAULT_TIMEOUT
+    deadline.timeout(timeout)
+    queue = pool.pick(2)
+    attempts, pending = [], set()
+    error = response = None
+
+    while True:
+        if queue:
+            ep = queue.pop(0)
+            try:
+                deadline.timeout(timeout)
+                future = _launch(pool, ep, method, path, timeout, priority, kwargs)
+            except (breaker.CircuitOpen, deadline.DeadlineExceeded) as e:
+                error = e
+                continue
+            if attempts:
+                pool.count_hedge()
+            attempts.append(future)
+            pending.add(future)
+        if not pending:
+            break
+        # Wake up after the hedge delay while there is another endpoint to try
+        done, pending = wait(pending, timeout=pool.hedge_delay() if queue else None,
+                             return_when=FIRST_COMPLETED)
+        for f in done:
+            if f.exception() is not None:
+                error = f.exception()
+            elif breaker.is_bad_status(f.result().status_code):
+                response = f.result()
+            else:
+                for other in pending:
+                    other.cancel()
+                if f is not attempts[0]:
+                    pool.count_hedge_win()
+                return f.result()
+
+    if response is not None:
+        return response
+    _failed(error)
+    raise error
+
+
+def hedged_get(pool, path='', timeout=None, priority=INTERACTIVE, **kwargs):
+    return _hedged(pool, 'GET', path, timeout, priority, **kwargs)
+
+
+def hedged_post(pool, path='', timeout=None, priority=INTERACTIVE, **kwargs):
+    return _hedged(pool, 'POST', path, timeout, priority, **kwargs)
+
+
+def pool_stats():
+    with _lock:
+        stats = {'hosts': sorted(_sessions), 'pool_size': POOL_SIZE, 'retries': RETRIES}
+    stats['async_gateway'] = _gateway.stats() if _gateway is not None else None
+    stats['endpoint_pools'] = endpoints.stats()
+    return stats
@@ -0,0 +1,14 @@
+"""
+WSGI entry point for production servers:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+When started by gunicorn.conf.py the database has already been created, upgraded
+and seeded the database, so workers skip that step. Any other WSGI server
+gets the full create_app().
+"""
+import os
+
+from app import create_app
+
+app = create_app(init_database=os.environ.get('TRIP_PLANNER_DB_READY') != '1')